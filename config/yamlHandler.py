@@ -1,7 +1,10 @@
 import os
+from pathlib import Path
 import yaml
 
 config_path = os.path.join(os.path.dirname(__file__), "conf.yml")
+# the filter reads it and main watches it, so it lives with the rest of the config instead of in either of them
+banned_keywords_path = Path(__file__).parent / "banned-keywords.config"
 
 with open(config_path, "r", encoding="utf-8-sig") as file:
     _config = yaml.safe_load(file)
@@ -28,11 +31,15 @@ def _normalize(value):
 
     return value
 
-def get_value(*keys):
+_MISSING = object()
+
+def get_value(*keys, default=_MISSING):
     value = _config
     for key in keys:
         if isinstance(value, dict) and key in value:
             value = value[key]
         else:
+            if default is not _MISSING:
+                return default
             raise KeyError(f"Key path {' -> '.join(keys)} not found in config.")
     return _normalize(value)
\ No newline at end of file
@@ -6,20 +6,19 @@ from discord.ext import commands, tasks
 import json
 from datetime import datetime, timedelta, timezone
 from asyncio import create_task, sleep
-from concurrent.futures import ThreadPoolExecutor
 import time
 import signal
 from pathlib import Path
 import re
 from typing import Optional
 
-from PerfectionBot.config.yamlHandler import get_value
-from PerfectionBot.scripts.filter import check_bad
+from PerfectionBot.config.yamlHandler import get_value, banned_keywords_path as BANNED_FILE
+from PerfectionBot.scripts.filter_engine import engine as filter_engine, Unverified
 from PerfectionBot.scripts import watchdog, yt, verify
 from PerfectionBot.scripts.lockdown import initiate_lockdown, handle_confirm, handle_revoke
-from PerfectionBot.scripts.log import log_to_channel
-from PerfectionBot.scripts import leveling
-from PerfectionBot.scripts.appeals import save_appeals, load_appeals
+from PerfectionBot.scripts.log import log_to_channel, flush_logs
+from PerfectionBot.scripts import leveling, memstore, broadcast, metrics
+from PerfectionBot.scripts.appeals import save_appeals, load_appeals, get_appeal, put_appeal, update_appeal, find_by_review, find_archived, pop_expired
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -38,11 +37,8 @@ except Exception:
     GUILD_TEST_ID = 944961657128497212
 TEST_GUILD = discord.Object(id=GUILD_TEST_ID)
 
-executor = ThreadPoolExecutor()
 
 flag_memory: dict[int, dict[int, dict]] = {}
-_flag_msgs: dict[int, discord.Message] = {}
-_xp_msgs: dict[int, discord.Message] = {}
 verify_msg_ids: dict[int, int] = {}
 _save_queue: set[int] = set()
 
@@ -51,16 +47,16 @@ DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 banned_keywords: set[str] = set()
-BANNED_FILE = Path("banned-keywords.config")
-APPEALS_PATH = DATA_DIR / "appeals.json"
-
-appeals: dict[str, dict] = {}
 
 FLAGS_FILE = DATA_DIR / "flags.dat"
 XP_FILE = Path(leveling.FILE)
-xp_memory: dict[int, int] = {}
-_xp_initialized = False
-_xp_lock = asyncio.Lock()
+# guild -> change count, a push only clears the guild if nothing changed while it was being written
+_xp_dirty_guilds: dict[int, int] = {}
+# legacy pins hold pre-per-guild xp; only this guild may adopt them, and only if xp.dat started out empty
+_xp_legacy_home: Optional[int] = None
+_xp_store_empty = False
+XP_FLUSH_INTERVAL = float(get_value("LEVELING", "FLUSH_INTERVAL", default=5))
+XP_PIN_SYNC_INTERVAL = float(get_value("LEVELING", "PIN_SYNC_INTERVAL", default=60))
 
 def sys_enabled(name: str) -> bool:
     try:
@@ -105,31 +101,6 @@ def load_banned_keywords():
 
 load_banned_keywords()
 
-def parse_flags_lines(lines, guild_id=None):
-    out = {}
-    for ln in lines:
-        ln = ln.strip()
-        if not ln:
-            continue
-        parts = ln.split(":")
-        if len(parts) == 2:
-            try:
-                uid = int(parts[0].strip())
-                amt = int(parts[1].strip())
-                out[uid] = {"flags_total": amt}
-            except Exception:
-                continue
-        elif len(parts) == 3:
-            try:
-                gid = int(parts[0].strip())
-                uid = int(parts[1].strip())
-                amt = int(parts[2].strip())
-                if guild_id is None or guild_id == gid:
-                    out.setdefault(uid, {"flags_total": amt})
-            except Exception:
-                continue
-    return out
-
 def load_flags_from_file_global():
     data = {}
     if not FLAGS_FILE.exists():
@@ -169,25 +140,36 @@ async def write_flags_file_from_memory():
     except Exception as e:
         print(f"[write_flags_file_from_memory] scheduling write failed: {e}")
 
-async def _load_flags(guild: discord.Guild):
-    data = {}
+async def _get_mem_channel(guild: discord.Guild, create: bool = True):
     mem = discord.utils.get(guild.text_channels, name="bot-mem")
+    if mem or not create:
+        return mem
+    try:
+        return await guild.create_text_channel(
+            "bot-mem",
+            overwrites={
+                guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                guild.me: discord.PermissionOverwrite(read_messages=True)
+            }
+        )
+    except Exception as e:
+        print(f"[get_mem_channel] failed to create bot-mem: {e}")
+        return None
+
+async def _load_flags(guild: discord.Guild):
+    mem = await _get_mem_channel(guild, create=False)
     if mem:
         try:
-            pinned = await mem.pins()
-            for p in pinned:
-                if p.content.startswith("[FLAGS]\n"):
-                    body = p.content.split("\n", 1)[1] if "\n" in p.content else ""
-                    lines = body.splitlines()
-                    parsed = parse_flags_lines(lines, guild_id=guild.id)
-                    if parsed:
-                        flag_memory[guild.id] = parsed
-                        _flag_msgs[guild.id] = p
-                        try:
-                            await write_flags_file_from_memory()
-                        except Exception as e:
-                            print(f"[load_flags] write_flags_file_from_memory failed: {e}")
-                        return parsed
+            parsed = await memstore.load(mem, "FLAGS", guild.id)
+            # flag pins were always per guild, so the pre-shard format is still safe to read back
+            parsed = {**memstore.legacy_pairs("FLAGS", guild.id), **parsed}
+            if parsed:
+                flag_memory[guild.id] = {uid: {"flags_total": amt} for uid, amt in parsed.items()}
+                try:
+                    await write_flags_file_from_memory()
+                except Exception as e:
+                    print(f"[load_flags] write_flags_file_from_memory failed: {e}")
+                return flag_memory[guild.id]
         except Exception as e:
             print(f"[load_flags] reading pins failed: {e}")
     try:
@@ -200,62 +182,19 @@ async def _load_flags(guild: discord.Guild):
         return flag_memory[guild.id]
     return {}
 
+@metrics.timed("save_flags")
 async def _save_flags(guild: discord.Guild):
     try:
-        mem = discord.utils.get(guild.text_channels, name="bot-mem")
+        mem = await _get_mem_channel(guild)
         if not mem:
-            try:
-                mem = await guild.create_text_channel(
-                    "bot-mem",
-                    overwrites={
-                        guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                        guild.me: discord.PermissionOverwrite(read_messages=True)
-                    }
-                )
-            except Exception as e:
-                print(f"[save_flags] failed to create bot-mem channel: {e}")
-                return
+            return
         flag_users = flag_memory.get(guild.id, {})
         try:
             await write_flags_file_from_memory()
         except Exception as e:
             print(f"[save_flags] write_flags_file_from_memory failed: {e}")
-        msg = _flag_msgs.get(guild.id)
-        body = ""
-        for uid, data in flag_users.items():
-            body += f"{uid}:{data.get('flags_total',0)}\n"
-        content = "[FLAGS]\n" + body
-        if msg and not getattr(msg, "deleted", False):
-            try:
-                await msg.edit(content=content)
-            except Exception as e:
-                print(f"[save_flags] edit pinned msg failed: {e}")
-                msg = None
-        if not msg:
-            try:
-                pinned = await mem.pins()
-                found = None
-                for p in pinned:
-                    if p.content.startswith("[FLAGS]\n"):
-                        found = p
-                        break
-                if found:
-                    _flag_msgs[guild.id] = found
-                    try:
-                        await found.edit(content=content)
-                        msg = found
-                    except Exception as e:
-                        print(f"[save_flags] edit found pinned msg failed: {e}")
-                        msg = None
-            except Exception as e:
-                print(f"[save_flags] failed to inspect pins: {e}")
-        if not msg:
-            try:
-                sent = await mem.send(content)
-                await sent.pin()
-                _flag_msgs[guild.id] = sent
-            except Exception as e:
-                print(f"[save_flags] send+pin failed: {e}")
+        values = {uid: data.get("flags_total", 0) for uid, data in flag_users.items()}
+        await memstore.save(mem, "FLAGS", guild.id, values)
     except Exception as e:
         print(f"[save_flags] unexpected error: {e}")
 
@@ -263,161 +202,54 @@ def _queue_flag_save(guild_id: int):
     _save_queue.add(guild_id)
 
 async def _ensure_channels(guild: discord.Guild):
-    mem = discord.utils.get(guild.text_channels, name="bot-mem")
+    mem = await _get_mem_channel(guild)
     if not mem:
-        try:
-            mem = await guild.create_text_channel(
-                "bot-mem",
-                overwrites={
-                    guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                    guild.me: discord.PermissionOverwrite(read_messages=True)
-                }
-            )
-        except Exception as e:
-            print(f"[ensure_channels] failed to create bot-mem: {e}")
-            return
+        return
     await _load_flags(guild)
-    try:
-        pinned = await mem.pins()
-        for p in pinned:
-            if p.content.startswith("[FLAGS]\n"):
-                _flag_msgs[guild.id] = p
-                break
-    except Exception as e:
-        print(f"[ensure_channels] failed to read pins: {e}")
-
-async def _load_xp_from_pin_message(msg: discord.Message) -> dict[int, int]:
-    data = {}
-    body = msg.content.split("\n", 1)[1] if "\n" in msg.content else ""
-    for ln in body.splitlines():
-        ln = ln.strip()
-        if not ln or ":" not in ln:
-            continue
-        uid_s, xp_s = ln.split(":", 1)
-        try:
-            uid = int(uid_s.strip())
-            xp = int(xp_s.strip())
-            data[uid] = xp
-        except Exception:
-            continue
-    return data
 
 async def _load_xp_prefer_pins(guild: discord.Guild):
-    global _xp_initialized, xp_memory
     if not sys_enabled("leveling"):
         return
-    mem = discord.utils.get(guild.text_channels, name="bot-mem")
+    mem = await _get_mem_channel(guild, create=False)
     if not mem:
         return
     try:
-        pinned = await mem.pins()
+        data = await memstore.load(mem, "XP", guild.id)
     except Exception as e:
         print(f"[load_xp_prefer_pins] pins failed: {e}")
         return
-    for p in pinned:
-        if p.content.startswith("[XP]\n"):
-            data = await _load_xp_from_pin_message(p)
-            if data:
-                if not _xp_initialized:
-                    xp_memory = data.copy()
-                    _xp_initialized = True
-                _xp_msgs[guild.id] = p
-                return
+    if not data and _xp_store_empty and guild.id == _xp_legacy_home:
+        data = memstore.legacy_pairs("XP", guild.id)
+    if data:
+        await asyncio.to_thread(leveling.adopt_xp, guild.id, data)
 
 async def _ensure_xp_msg_for_guild(guild: discord.Guild):
     if not sys_enabled("leveling"):
         return
-    mem = discord.utils.get(guild.text_channels, name="bot-mem")
-    if not mem:
-        try:
-            mem = await guild.create_text_channel(
-                "bot-mem",
-                overwrites={
-                    guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                    guild.me: discord.PermissionOverwrite(read_messages=True)
-                }
-            )
-        except Exception as e:
-            print(f"[ensure_xp_msg_for_guild] failed to create bot-mem: {e}")
-            return
-    try:
-        pinned = await mem.pins()
-    except Exception as e:
-        pinned = []
-        print(f"[ensure_xp_msg_for_guild] failed to read pins: {e}")
-    for p in pinned:
-        if p.content.startswith("[XP]\n"):
-            _xp_msgs[guild.id] = p
-            return
-    try:
-        content = "[XP]\n"
-        for uid, xp in xp_memory.items():
-            content += f"{uid}:{xp}\n"
-        sent = await mem.send(content)
-        await sent.pin()
-        _xp_msgs[guild.id] = sent
-    except Exception as e:
-        print(f"[ensure_xp_msg_for_guild] create xp msg failed: {e}")
+    # memstore skips shards that already match, so this only writes when the pins are missing or stale
+    await _push_xp_to_mem_for_guild(guild)
 
-async def _push_xp_to_mem_for_guild(guild: discord.Guild):
+async def _push_xp_to_mem_for_guild(guild: discord.Guild) -> bool:
     if not sys_enabled("leveling"):
-        return
+        return False
     try:
-        mem = discord.utils.get(guild.text_channels, name="bot-mem")
+        mem = await _get_mem_channel(guild)
         if not mem:
-            try:
-                mem = await guild.create_text_channel(
-                    "bot-mem",
-                    overwrites={
-                        guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                        guild.me: discord.PermissionOverwrite(read_messages=True)
-                    }
-                )
-            except Exception as e:
-                print(f"[push_xp_to_mem_for_guild] create bot-mem failed: {e}")
-                return
-        body = ""
-        for uid, xp in xp_memory.items():
-            body += f"{uid}:{xp}\n"
-        content = "[XP]\n" + body
-        msg = _xp_msgs.get(guild.id)
-        if msg and not getattr(msg, "deleted", False):
-            try:
-                await msg.edit(content=content)
-                return
-            except Exception as e:
-                print(f"[push_xp] edit xp msg failed: {e}")
-                msg = None
-        try:
-            pinned = await mem.pins()
-            found = None
-            for p in pinned:
-                if p.content.startswith("[XP]\n"):
-                    found = p
-                    break
-            if found:
-                _xp_msgs[guild.id] = found
-                try:
-                    await found.edit(content=content)
-                    return
-                except Exception as e:
-                    print(f"[push_xp] edit found pinned xp msg failed: {e}")
-        except Exception as e:
-            print(f"[push_xp] reading pins failed: {e}")
-        try:
-            sent = await mem.send(content)
-            await sent.pin()
-            _xp_msgs[guild.id] = sent
-        except Exception as e:
-            print(f"[push_xp] send+pin xp msg failed: {e}")
+            return False
+        table = leveling.guild_xp(guild.id)
+        await memstore.save(mem, "XP", guild.id, dict(table.items()))
+        return memstore.in_sync("XP", guild.id)
     except Exception as e:
         print(f"[push_xp_to_mem_for_guild] unexpected error: {e}")
+        return False
 
+@metrics.timed("handle_message_event")
 async def handle_message_event(message, *, is_edit=False, before_msg=None):
     if message.author.bot or not message.guild:
         return
 
     guild_id, user_id = message.guild.id, message.author.id
+    metrics.counter("messages", guild=guild_id).inc()
 
     hit = None
     if sys_enabled("filter"):
@@ -426,25 +258,18 @@ async def handle_message_event(message, *, is_edit=False, before_msg=None):
                 return
         except Exception:
             pass
-        hit = await bot.loop.run_in_executor(executor, check_bad, message.content)
+        hit = await filter_engine.check(message.content)
+        if isinstance(hit, Unverified):
+            create_task(_recheck_late(message, hit.future, is_edit=is_edit))
+            return
 
     if not hit and not is_edit and sys_enabled("leveling"):
-        try:
-            prev_xp = await asyncio.to_thread(leveling.read_xp, user_id)
-        except Exception:
-            prev_xp = xp_memory.get(user_id, 0)
+        new_xp = leveling.write_xp(guild_id, user_id, 2)
+        prev_xp = new_xp - 2
+        _xp_dirty_guilds[guild_id] = _xp_dirty_guilds.get(guild_id, 0) + 1
 
-        new_xp = prev_xp + 2
-        try:
-            await asyncio.to_thread(leveling.write_xp, user_id, 2)
-        except Exception:
-            pass
-
-        async with _xp_lock:
-            xp_memory[user_id] = new_xp
-
-        prev_lvl = await bot.loop.run_in_executor(executor, leveling.convertToLevel, prev_xp)
-        lvl = await bot.loop.run_in_executor(executor, leveling.convertToLevel, new_xp)
+        prev_lvl = leveling.convertToLevel(prev_xp)
+        lvl = leveling.convertToLevel(new_xp)
 
         if lvl > prev_lvl:
             new_role = None
@@ -477,15 +302,24 @@ async def handle_message_event(message, *, is_edit=False, before_msg=None):
                         inline=False
                     )
                 await chnl.send(embed=new_embed)
-
-        try:
-            await _push_xp_to_mem_for_guild(message.guild)
-        except Exception:
-            pass
         return
 
     if not hit:
         return
+    await _flag_message(message, hit, is_edit=is_edit)
+
+async def _recheck_late(message, late, *, is_edit=False):
+    # the filter timed out or failed; the message earned no xp and is judged once a verdict lands
+    try:
+        hit = await late
+    except Exception as e:
+        print(f"[filter] late re-check failed: {e}")
+        return
+    if hit:
+        await _flag_message(message, hit, is_edit=is_edit)
+
+async def _flag_message(message, hit: dict, *, is_edit=False):
+    guild_id, user_id = message.guild.id, message.author.id
 
     try:
         await message.delete()
@@ -514,7 +348,7 @@ async def handle_message_event(message, *, is_edit=False, before_msg=None):
         dm_msg = await message.author.send(prefix + tmpl.format(word=flagged_word))
         await dm_msg.add_reaction("⚠️")
 
-        appeals[str(dm_msg.id)] = {
+        put_appeal(str(dm_msg.id), {
             "user_id": user_id,
             "guild_id": guild_id,
             "warn_time": datetime.now(timezone.utc).isoformat(),
@@ -524,8 +358,8 @@ async def handle_message_event(message, *, is_edit=False, before_msg=None):
             "review_msg_id": None,
             "review_time": None,
             "review_by": None
-        }
-        save_appeals()
+        })
+        await save_appeals()
     except Exception:
         create_task(log_to_channel(message.guild, f"❌ Warn DM failed", discord.Color.red(), "fail"))
 
@@ -553,14 +387,37 @@ async def handle_message_event(message, *, is_edit=False, before_msg=None):
 
     _queue_flag_save(guild_id)
 
-@tasks.loop(seconds=60)
+@tasks.loop(seconds=XP_PIN_SYNC_INTERVAL)
 async def push_xp_to_mem():
     if not sys_enabled("leveling"):
         return
-    coros = [_push_xp_to_mem_for_guild(g) for g in bot.guilds]
+    to_push = dict(_xp_dirty_guilds)
+
+    async def _push(gid: int, version: int):
+        guild = bot.get_guild(gid)
+        if guild is None:
+            _xp_dirty_guilds.pop(gid, None)
+            return
+        # a failed save keeps the guild dirty so the next round retries it
+        if await _push_xp_to_mem_for_guild(guild) and _xp_dirty_guilds.get(gid) == version:
+            del _xp_dirty_guilds[gid]
+
+    coros = [_push(gid, version) for gid, version in to_push.items()]
     if coros:
         await _run_with_semaphore(coros, limit=6)
 
+async def _flush_xp():
+    if not leveling.pending_xp():
+        return
+    try:
+        await asyncio.to_thread(leveling.flush_xp)
+    except Exception as e:
+        print(f"[flush_xp] writing {leveling.pending_xp()} entries failed: {e}")
+
+@tasks.loop(seconds=XP_FLUSH_INTERVAL)
+async def flush_xp():
+    await _flush_xp()
+
 @tasks.loop(seconds=5)
 async def flush_flag_saves():
     to_save = list(_save_queue)
@@ -591,43 +448,32 @@ async def reload_banned_keywords_task():
         return
     try:
         await asyncio.to_thread(load_banned_keywords)
+        await asyncio.to_thread(filter_engine.reload_blacklist)
     except Exception as e:
         print(f"[reload_banned_keywords_task] failed: {e}")
 
-_monitor_last = time.perf_counter()
-@tasks.loop(seconds=2)
-async def monitor_lag():
-    global _monitor_last
-    now = time.perf_counter()
-    delay = now - _monitor_last - 2
-    _monitor_last = now
-    if delay > 0.1:
-        print(f"⚠️ Event loop lag detected: {delay:.3f}s")
-
 @tasks.loop(minutes=1)
 async def appeal_timeouts():
     now = datetime.now(timezone.utc)
-    for dm_msg_id, appeal in list(appeals.items()):
+    expired = pop_expired(now)
+    if not expired:
+        return
+    notify = []
+    for dm_msg_id, appeal in expired:
+        # unanswered warns just leave the working set, a late ⚠️ is answered from the archive
         if appeal.get("status") == "appealed":
-            try:
-                review_time = datetime.fromisoformat(appeal.get("review_time"))
-            except Exception:
-                review_time = None
-            if not review_time:
-                continue
-            if now - review_time > timedelta(hours=24):
-                appeal["status"] = "timed_out"
-                appeal["review_time"] = now.isoformat()
-                appeals[dm_msg_id] = appeal
-                save_appeals()
-                try:
-                    uobj = await bot.fetch_user(appeal["user_id"])
-                    await uobj.send("⏳ No moderator reviewed your appeal within 24 hours — appeal timed out.")
-                except Exception:
-                    pass
-                gobj = bot.get_guild(appeal.get("guild_id"))
-                if gobj:
-                    create_task(log_to_channel(gobj, f"⚪ Appeal timed out for <@{appeal['user_id']}>", discord.Color.dark_grey(), "info"))
+            notify.append(appeal)
+        update_appeal(dm_msg_id, status="timed_out", review_time=now.isoformat())
+    await save_appeals()
+    for appeal in notify:
+        try:
+            uobj = await bot.fetch_user(appeal["user_id"])
+            await uobj.send("⏳ No moderator reviewed your appeal within 24 hours — appeal timed out.")
+        except Exception:
+            pass
+        gobj = bot.get_guild(appeal.get("guild_id"))
+        if gobj:
+            create_task(log_to_channel(gobj, f"⚪ Appeal timed out for <@{appeal['user_id']}>", discord.Color.dark_grey(), "info"))
 
 @bot.event
 async def on_ready():
@@ -668,6 +514,15 @@ async def on_ready():
     if coros:
         await _run_with_semaphore(coros, limit=6)
 
+    if sys_enabled("leveling") and bot.guilds:
+        global _xp_legacy_home
+        primary = bot.get_guild(GUILD_TEST_ID) or bot.guilds[0]
+        _xp_legacy_home = primary.id
+        try:
+            await asyncio.to_thread(leveling.claim_legacy, primary.id)
+        except Exception as e:
+            print(f"[on_ready] migrating legacy xp failed: {e}")
+
     coros2 = []
     for guild in bot.guilds:
         async def _do_guild_init(g=guild):
@@ -703,6 +558,11 @@ async def on_ready():
     except Exception as e:
         print(f"[on_ready] loading global flags failed: {e}")
 
+    try:
+        await broadcast.resume_pending(bot)
+    except Exception as e:
+        print(f"[on_ready] resuming broadcasts failed: {e}")
+
     try:
         if sys_enabled("yt"):
             bot.loop.create_task(yt.monitor_channel(bot))
@@ -711,7 +571,6 @@ async def on_ready():
 
     try:
         flush_flag_saves.start()
-        monitor_lag.start()
         push_flags_to_mem.start()
 
         if sys_enabled("filter"):
@@ -719,6 +578,7 @@ async def on_ready():
 
         if sys_enabled("leveling"):
             push_xp_to_mem.start()
+            flush_xp.start()
 
         appeal_timeouts.start()
     except Exception as e:
@@ -753,12 +613,22 @@ async def on_ready():
         print(f"[on_ready] sync logic failed: {e}")
 
 @bot.event
+@metrics.timed("on_raw_reaction_add")
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     if payload.user_id == bot.user.id:
         return
     if payload.guild_id is None:
-        ap = appeals.get(str(payload.message_id))
+        ap = get_appeal(str(payload.message_id))
         if not ap:
+            if str(payload.emoji) != "⚠️":
+                return
+            old = await asyncio.to_thread(find_archived, str(payload.message_id))
+            if old and old.get("user_id") == payload.user_id and old.get("status") == "timed_out" and not old.get("review_msg_id"):
+                try:
+                    user_obj = await bot.fetch_user(payload.user_id)
+                    await user_obj.send("❌ Appeal failed: appeal window of 24 hours has expired.")
+                except Exception:
+                    pass
             return
         if ap.get("status") != "warned":
             return
@@ -771,10 +641,8 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
         except Exception:
             warn_time = None
         if warn_time and datetime.now(timezone.utc) - warn_time > timedelta(hours=24):
-            ap["status"] = "timed_out"
-            ap["review_time"] = datetime.now(timezone.utc).isoformat()
-            appeals[str(payload.message_id)] = ap
-            save_appeals()
+            update_appeal(str(payload.message_id), status="timed_out", review_time=datetime.now(timezone.utc).isoformat())
+            await save_appeals()
             try:
                 user_obj = await bot.fetch_user(ap["user_id"])
                 await user_obj.send("❌ Appeal failed: appeal window of 24 hours has expired.")
@@ -812,13 +680,12 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
             await review_msg.add_reaction("❌")
         except Exception:
             review_msg = None
-        ap["status"] = "appealed"
+        changes = {"status": "appealed", "review_by": None}
         if review_msg:
-            ap["review_msg_id"] = review_msg.id
-            ap["review_time"] = datetime.now(timezone.utc).isoformat()
-        ap["review_by"] = None
-        appeals[str(payload.message_id)] = ap
-        save_appeals()
+            changes["review_msg_id"] = review_msg.id
+            changes["review_time"] = datetime.now(timezone.utc).isoformat()
+        update_appeal(str(payload.message_id), **changes)
+        await save_appeals()
         try:
             user_obj = await bot.fetch_user(orig_user)
             await user_obj.send("✅ Your appeal was submitted to moderators for review.")
@@ -837,53 +704,48 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
             create_task(log_to_channel(guild, f"✅ Verified {member.mention}", discord.Color.green(), "verify"))
         except Exception:
             pass
-    for dm_msg_id, ap in list(appeals.items()):
-        if ap.get("review_msg_id") != payload.message_id:
-            continue
-        if ap.get("status") != "appealed":
-            continue
-        member = guild.get_member(payload.user_id)
-        if not member:
-            return
-        if not member.guild_permissions.ban_members:
-            return
-        emoji = str(payload.emoji)
-        if emoji == "✅":
-            target_uid = ap["user_id"]
-            gm = ap["guild_id"]
-            gm_flags = flag_memory.setdefault(gm, {})
-            user_flags = gm_flags.setdefault(target_uid, {"flags_total": 0})
-            before = user_flags["flags_total"]
-            user_flags["flags_total"] = max(before - 1, 0)
-            ap["status"] = "accepted"
-            ap["review_by"] = payload.user_id
-            ap["review_time"] = datetime.now(timezone.utc).isoformat()
-            appeals[dm_msg_id] = ap
-            save_appeals()
-            try:
-                await _save_flags(bot.get_guild(gm))
-            except Exception:
-                pass
-            try:
-                uobj = await bot.fetch_user(target_uid)
-                await uobj.send("✅ Your appeal was accepted by moderators. 1 flag removed.")
-            except Exception:
-                pass
-            create_task(log_to_channel(bot.get_guild(gm) or guild, f"🟢 Appeal accepted for <@{target_uid}> by {member.mention}", discord.Color.blurple(), "info"))
-            return
-        if emoji == "❌":
-            ap["status"] = "rejected"
-            ap["review_by"] = payload.user_id
-            ap["review_time"] = datetime.now(timezone.utc).isoformat()
-            appeals[dm_msg_id] = ap
-            save_appeals()
-            try:
-                uobj = await bot.fetch_user(ap["user_id"])
-                await uobj.send("❌ Your appeal was rejected by moderators.")
-            except Exception:
-                pass
-            create_task(log_to_channel(guild, f"🔴 Appeal rejected for <@{ap['user_id']}> by {member.mention}", discord.Color.blurple(), "info"))
-            return
+    found = find_by_review(payload.message_id)
+    if not found:
+        return
+    dm_msg_id, ap = found
+    if ap.get("status") != "appealed":
+        return
+    member = guild.get_member(payload.user_id)
+    if not member:
+        return
+    if not member.guild_permissions.ban_members:
+        return
+    emoji = str(payload.emoji)
+    if emoji == "✅":
+        target_uid = ap["user_id"]
+        gm = ap["guild_id"]
+        gm_flags = flag_memory.setdefault(gm, {})
+        user_flags = gm_flags.setdefault(target_uid, {"flags_total": 0})
+        before = user_flags["flags_total"]
+        user_flags["flags_total"] = max(before - 1, 0)
+        update_appeal(dm_msg_id, status="accepted", review_by=payload.user_id, review_time=datetime.now(timezone.utc).isoformat())
+        await save_appeals()
+        try:
+            await _save_flags(bot.get_guild(gm))
+        except Exception:
+            pass
+        try:
+            uobj = await bot.fetch_user(target_uid)
+            await uobj.send("✅ Your appeal was accepted by moderators. 1 flag removed.")
+        except Exception:
+            pass
+        create_task(log_to_channel(bot.get_guild(gm) or guild, f"🟢 Appeal accepted for <@{target_uid}> by {member.mention}", discord.Color.blurple(), "info"))
+        return
+    if emoji == "❌":
+        update_appeal(dm_msg_id, status="rejected", review_by=payload.user_id, review_time=datetime.now(timezone.utc).isoformat())
+        await save_appeals()
+        try:
+            uobj = await bot.fetch_user(ap["user_id"])
+            await uobj.send("❌ Your appeal was rejected by moderators.")
+        except Exception:
+            pass
+        create_task(log_to_channel(guild, f"🔴 Appeal rejected for <@{ap['user_id']}> by {member.mention}", discord.Color.blurple(), "info"))
+        return
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -898,6 +760,13 @@ async def on_message_edit(before: discord.Message, after: discord.Message):
         return
     create_task(handle_message_event(after, is_edit=True, before_msg=before))
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    # measured from when discord created the interaction, so it includes gateway delay
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.histogram("app_command", command=command.qualified_name).observe(elapsed)
+    metrics.counter("app_commands", command=command.qualified_name).inc()
+
 class CtxWrapper:
     def __init__(self, interaction: discord.Interaction):
         self.interaction = interaction
@@ -1266,23 +1135,25 @@ async def sync_levels_cmd(interaction: discord.Interaction):
         return
 
     await interaction.response.send_message("⏳ Starting full level sync... This may take a while.")
-    count = 0
-    failed = 0
+    last_report = 0.0
 
-    for member in interaction.guild.members:
-        if member.bot:
-            continue
+    async def _report(done, total, failed):
+        nonlocal last_report
+        now = time.monotonic()
+        if done < total and now - last_report < 5:
+            return
+        last_report = now
         try:
-            xp = await asyncio.to_thread(leveling.read_xp, member.id)
-            lvl = await asyncio.to_thread(leveling.convertToLevel, xp)
-            await leveling.check_level_reward(member, lvl)
-            count += 1
-        except Exception as e:
-            print(f"[SyncLevels] Failed for {member}: {e}")
-            failed += 1
-        await asyncio.sleep(1.5)
+            await interaction.edit_original_response(content=f"⏳ Syncing level roles... {done}/{total} done, {failed} failed.")
+        except Exception:
+            pass
+
+    result = await leveling.sync_level_roles(interaction.guild, leveling.guild_xp(interaction.guild.id), on_progress=_report)
 
-    await interaction.followup.send(f"✅ Level sync complete! Processed {count} members, {failed} failed.")
+    await interaction.followup.send(
+        f"✅ Level sync complete! Checked {result['checked']} members, "
+        f"updated {result['updated']}, {result['failed']} failed."
+    )
 
 @bot.tree.command(name="lvl", description="Check user level", guild=TEST_GUILD)
 @app_commands.describe(user="User to check (optional)")
@@ -1293,18 +1164,17 @@ async def level_check_cmd(interaction: discord.Interaction, user: Optional[disco
 
     target = user or interaction.user
 
-    try:
-        xp = await asyncio.to_thread(leveling.read_xp, target.id)
-    except Exception:
-        xp = xp_memory.get(target.id, 0)
-
-    lvl = await asyncio.to_thread(leveling.convertToLevel, xp)
+    xp = leveling.read_xp(interaction.guild.id, target.id)
+    lvl, into, needed = leveling.progress(xp)
     color = get_level_role_color(target)
 
     embed = discord.Embed(title="📊 Level Info", color=color)
     embed.add_field(name="User", value=target.mention, inline=True)
     embed.add_field(name="Level", value=str(lvl), inline=True)
     embed.add_field(name="XP", value=str(xp), inline=True)
+    if needed:
+        filled = int(10 * into / needed)
+        embed.add_field(name="Progress", value=f"{'▰' * filled}{'▱' * (10 - filled)} {into}/{needed} XP", inline=False)
 
     await interaction.response.send_message(embed=embed)
 
@@ -1353,7 +1223,6 @@ class DMModal(discord.ui.Modal, title="Send DM"):
 
         sent_count = 0
         failed_count = 0
-        skipped_count = 0
         guild = modal_interaction.guild
         author = modal_interaction.user
 
@@ -1366,17 +1235,23 @@ class DMModal(discord.ui.Modal, title="Send DM"):
                 failed_count += 1
 
         if not targ:
-            members = [m for m in guild.members if not m.bot]
-            for m in members:
-                await _send_to_user(m)
-                await asyncio.sleep(0.35)
+            if broadcast.running(guild.id):
+                await modal_interaction.followup.send("❌ A DM broadcast is already running in this guild.", ephemeral=True)
+                return
+            progress_msg = await modal_interaction.followup.send("⏳ DM broadcast started...", ephemeral=True, wait=True)
 
-            summary = f"✅ DM broadcast complete. Sent: {sent_count}, Failed: {failed_count}, Skipped (bots): {skipped_count}."
-            try:
-                create_task(log_to_channel(guild, f"✉️ {author.mention} broadcasted a DM to the guild. Sent: {sent_count}, Failed: {failed_count}", discord.Color.blurple(), "dm"))
-            except Exception:
-                pass
-            await modal_interaction.followup.send(summary, ephemeral=True)
+            async def _report(job, final):
+                total = len(job.targets)
+                text = (f"✅ DM broadcast complete. {job.summary()}." if final
+                        else f"⏳ DM broadcast {job.done}/{total}. {job.summary()}.")
+                try:
+                    await progress_msg.edit(content=text)
+                except Exception:
+                    # the interaction token only lives 15 minutes, fall back to a DM for the result
+                    if final:
+                        await author.send(text)
+
+            await broadcast.start(guild, author, body, _report)
             return
 
         m = re.search(r"(\d{5,25})", targ)
@@ -1437,23 +1312,28 @@ async def dm_cmd(interaction: discord.Interaction):
         await interaction.followup.send("❌ Failed to open DM modal.", ephemeral=True)
 
 def get_level_role_color(member: discord.Member) -> discord.Color:
-    level_roles = leveling.read_level_roles()
-    member_level_roles = []
+    role_levels = leveling.reward_role_levels()
+    top_role = None
+    top_level = None
 
-    for lvl, role_id in level_roles:
-        role = member.guild.get_role(role_id)
-        if role and role in member.roles:
-            member_level_roles.append((lvl, role))
+    for role in member.roles:
+        lvl = role_levels.get(role.id)
+        if lvl is not None and (top_level is None or lvl > top_level):
+            top_role, top_level = role, lvl
 
-    if not member_level_roles:
+    if top_role is None:
         return discord.Color.default()
 
-    _, top_role = max(member_level_roles, key=lambda x: x[0])
-
     return top_role.color if top_role.color != discord.Color.default() else discord.Color.light_gray()
 
 async def main():
     await asyncio.to_thread(load_appeals)
+    await metrics.start_http()
+    global _xp_store_empty
+    try:
+        _xp_store_empty = await asyncio.to_thread(leveling.is_empty)
+    except Exception as e:
+        print(f"[main] loading xp failed: {e}")
     token = get_value("tokens", "bot")
     if not token:
         print("Bot token missing in config; exiting.")
@@ -1461,10 +1341,30 @@ async def main():
     await bot.start(token)
 
 async def shutdown():
+    try:
+        await _flush_xp()
+    except Exception as e:
+        print(f"[shutdown] flushing xp failed: {e}")
+    try:
+        await push_xp_to_mem()
+    except Exception as e:
+        print(f"[shutdown] pushing xp pins failed: {e}")
+    try:
+        await save_appeals()
+    except Exception as e:
+        print(f"[shutdown] saving appeals failed: {e}")
+    try:
+        await flush_logs()
+    except Exception as e:
+        print(f"[shutdown] flushing logs failed: {e}")
     try:
         await bot.close()
     except Exception:
         pass
+    try:
+        filter_engine.shutdown()
+    except Exception:
+        pass
     try:
         asyncio.get_event_loop().stop()
     except Exception:
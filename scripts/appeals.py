@@ -1,6 +1,12 @@
 # PerfectionBot/scripts/appeals.py
 
+import asyncio
+import gzip
+import heapq
 import json
+import os
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -8,24 +14,326 @@ DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 APPEALS_PATH = DATA_DIR / "appeals.json"
+JOURNAL_PATH = DATA_DIR / "appeals.journal"
+ARCHIVE_PATH = DATA_DIR / "appeals-archive.jsonl.gz"
+ARCHIVE_INDEX_PATH = DATA_DIR / "appeals-archive.idx"
 
+JOURNAL_COMPACT_LINES = 2000
+APPEAL_WINDOW = timedelta(hours=24)
+REVIEW_WINDOW = timedelta(hours=24)
+TERMINAL_STATUSES = frozenset({"accepted", "rejected", "timed_out"})
+
+# only warned and appealed appeals live here, finished ones go to the archive
 appeals: dict[str, dict] = {}
 
-def save_appeals():
+# keys mutated since the last save, in mutation order
+_dirty: dict[str, None] = {}
+# finished appeals waiting to be written to the archive
+_archiving: dict[str, dict] = {}
+_journal_lines = 0
+_file_lock = threading.Lock()
+_save_lock: asyncio.Lock | None = None
+
+# secondary indexes, only ever changed together with appeals through the functions below
+_by_review: dict[int, str] = {}
+_by_user: dict[int, set[str]] = {}
+_by_status: dict[str, set[str]] = {}
+
+# archived key -> byte offset of the gzip member holding it, so a lookup never scans the whole archive
+_archive_index: dict[str, int] = {}
+
+# (deadline timestamp, key); entries go stale when an appeal moves on and are skipped when popped
+_deadlines: list[tuple[float, str]] = []
+
+def _parse_time(value) -> datetime | None:
     try:
-        with APPEALS_PATH.open("w", encoding="utf-8") as f:
-            json.dump(appeals, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"Failed to save appeals.json: {e}")
+        return datetime.fromisoformat(value)
+    except Exception:
+        return None
+
+def deadline_of(ap: dict) -> float | None:
+    status = ap.get("status")
+    if status == "warned":
+        start, window = _parse_time(ap.get("warn_time")), APPEAL_WINDOW
+    elif status == "appealed":
+        start, window = _parse_time(ap.get("review_time")), REVIEW_WINDOW
+    else:
+        return None
+    return (start + window).timestamp() if start else None
+
+def _index(key: str, ap: dict):
+    review_id = ap.get("review_msg_id")
+    if review_id is not None:
+        _by_review[review_id] = key
+    _by_user.setdefault(ap.get("user_id"), set()).add(key)
+    _by_status.setdefault(ap.get("status"), set()).add(key)
+    deadline = deadline_of(ap)
+    if deadline is not None:
+        heapq.heappush(_deadlines, (deadline, key))
+
+def _unindex(key: str, ap: dict):
+    review_id = ap.get("review_msg_id")
+    if review_id is not None and _by_review.get(review_id) == key:
+        del _by_review[review_id]
+    for idx, field in ((_by_user, "user_id"), (_by_status, "status")):
+        keys = idx.get(ap.get(field))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del idx[ap.get(field)]
+
+def _rebuild_indexes():
+    _by_review.clear()
+    _by_user.clear()
+    _by_status.clear()
+    _deadlines.clear()
+    for key, ap in appeals.items():
+        _index(key, ap)
+
+def _mark(key: str):
+    _dirty.pop(key, None)
+    _dirty[key] = None
+
+def _retire(key: str, ap: dict):
+    del appeals[key]
+    _archiving[key] = ap
+
+def get_appeal(key: str) -> dict | None:
+    return appeals.get(key)
+
+def put_appeal(key: str, ap: dict):
+    old = appeals.get(key)
+    if old is not None:
+        _unindex(key, old)
+    appeals[key] = ap
+    if ap.get("status") in TERMINAL_STATUSES:
+        _retire(key, ap)
+    else:
+        _index(key, ap)
+    _mark(key)
+
+def update_appeal(key: str, **changes) -> dict | None:
+    ap = appeals.get(key)
+    if ap is None:
+        return None
+    _unindex(key, ap)
+    ap.update(changes)
+    if ap.get("status") in TERMINAL_STATUSES:
+        _retire(key, ap)
+    else:
+        _index(key, ap)
+    _mark(key)
+    return ap
+
+def remove_appeal(key: str) -> dict | None:
+    ap = appeals.pop(key, None)
+    if ap is not None:
+        _unindex(key, ap)
+        _mark(key)
+    return ap
+
+def find_by_review(review_msg_id: int) -> tuple[str, dict] | None:
+    key = _by_review.get(review_msg_id)
+    if key is None:
+        return None
+    return key, appeals[key]
+
+def keys_for_user(user_id: int) -> set[str]:
+    return set(_by_user.get(user_id, ()))
+
+def keys_with_status(status: str) -> set[str]:
+    return set(_by_status.get(status, ()))
+
+def pop_expired(now: datetime) -> list[tuple[str, dict]]:
+    # only touches heap entries whose deadline has passed
+    ts = now.timestamp()
+    expired = []
+    seen = set()
+    while _deadlines and _deadlines[0][0] <= ts:
+        deadline, key = heapq.heappop(_deadlines)
+        ap = appeals.get(key)
+        if ap is None or key in seen or deadline_of(ap) != deadline:
+            continue
+        seen.add(key)
+        expired.append((key, ap))
+    return expired
+
+def _append_archive(records: list[tuple[str, dict]]):
+    offset = ARCHIVE_PATH.stat().st_size if ARCHIVE_PATH.exists() else 0
+    # every append is its own gzip member, gzip readers walk them back to back
+    with gzip.open(ARCHIVE_PATH, "at", encoding="utf-8") as f:
+        f.write("".join(json.dumps({"key": k, "appeal": ap}, ensure_ascii=False) + "\n" for k, ap in records))
+    with ARCHIVE_INDEX_PATH.open("a", encoding="utf-8") as f:
+        f.write("".join(f"{k} {offset}\n" for k, _ in records))
+    for k, _ in records:
+        _archive_index[k] = offset
+
+def _load_archive_index():
+    _archive_index.clear()
+    if ARCHIVE_INDEX_PATH.exists():
+        with ARCHIVE_INDEX_PATH.open("r", encoding="utf-8") as f:
+            for line in f:
+                key, _, offset = line.strip().partition(" ")
+                try:
+                    _archive_index[key] = int(offset)
+                except ValueError:
+                    continue
+    elif ARCHIVE_PATH.exists():
+        # archive written before the index existed, offset 0 still finds the key by reading from the start
+        _archive_index.update((k, 0) for k, _ in iter_archive())
+        with ARCHIVE_INDEX_PATH.open("w", encoding="utf-8") as f:
+            f.write("".join(f"{k} 0\n" for k in _archive_index))
+
+def iter_archive():
+    if not ARCHIVE_PATH.exists():
+        return
+    try:
+        with gzip.open(ARCHIVE_PATH, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    yield rec["key"], rec["appeal"]
+                except Exception:
+                    continue
+    except (EOFError, OSError) as e:
+        # a member cut short by a crash only loses the records after it
+        print(f"Appeals archive read stopped early: {e}")
+
+def find_archived(key: str) -> dict | None:
+    offset = _archive_index.get(key)
+    if offset is None:
+        return None
+    try:
+        with ARCHIVE_PATH.open("rb") as raw:
+            raw.seek(offset)
+            with gzip.open(raw, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except Exception:
+                        continue
+                    if rec.get("key") == key:
+                        return rec.get("appeal")
+    except (EOFError, OSError) as e:
+        print(f"Appeals archive read stopped early: {e}")
+    return None
+
+def archived_for_user(user_id: int) -> dict[str, dict]:
+    return {k: ap for k, ap in iter_archive() if ap.get("user_id") == user_id}
+
+def _append_journal(lines: list[str]):
+    global _journal_lines
+    with _file_lock:
+        with JOURNAL_PATH.open("a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        _journal_lines += len(lines)
+
+def _write_snapshot(snapshot: dict[str, dict]):
+    global _journal_lines
+    with _file_lock:
+        tmp = APPEALS_PATH.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, APPEALS_PATH)
+        # journal records hold the full appeal, replaying ones the snapshot
+        # already contains after a crash here is harmless
+        with JOURNAL_PATH.open("w", encoding="utf-8"):
+            pass
+        _journal_lines = 0
+
+async def save_appeals():
+    global _save_lock
+    if _save_lock is None:
+        _save_lock = asyncio.Lock()
+    # one save at a time keeps journal records in mutation order
+    async with _save_lock:
+        if not _dirty:
+            return
+        keys = list(_dirty)
+        _dirty.clear()
+        retired = [(k, _archiving.pop(k)) for k in keys if k in _archiving]
+        if retired:
+            try:
+                # archive first, the journal only drops an appeal once its final state is on disk
+                await asyncio.to_thread(_append_archive, retired)
+            except Exception as e:
+                print(f"Failed to write appeals archive: {e}")
+                for k, ap in retired:
+                    _archiving.setdefault(k, ap)
+                for k in keys:
+                    _dirty.setdefault(k, None)
+                return
+        lines = [json.dumps({"key": k, "appeal": appeals.get(k)}, ensure_ascii=False) + "\n" for k in keys]
+        try:
+            await asyncio.to_thread(_append_journal, lines)
+        except Exception as e:
+            print(f"Failed to write appeals journal: {e}")
+            for k in keys:
+                _dirty.setdefault(k, None)
+            return
+        if _journal_lines >= JOURNAL_COMPACT_LINES:
+            snapshot = {k: dict(ap) for k, ap in appeals.items()}
+            try:
+                await asyncio.to_thread(_write_snapshot, snapshot)
+            except Exception as e:
+                print(f"Failed to compact appeals.json: {e}")
+
+def _replay_journal(into: dict[str, dict]) -> int:
+    count = 0
+    with JOURNAL_PATH.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                key = rec["key"]
+            except Exception:
+                # a torn last line from a crash mid-append
+                continue
+            if rec.get("appeal") is None:
+                into.pop(key, None)
+            else:
+                into[key] = rec["appeal"]
+            count += 1
+    return count
 
 def load_appeals():
-    global appeals
+    global _journal_lines
+    loaded = {}
     try:
         if APPEALS_PATH.exists():
             with APPEALS_PATH.open("r", encoding="utf-8") as f:
-                appeals = json.load(f)
-        else:
-            appeals = {}
+                loaded = json.load(f)
     except Exception as e:
         print(f"Failed to load appeals.json: {e}")
-        appeals = {}
\ No newline at end of file
+    try:
+        _journal_lines = _replay_journal(loaded) if JOURNAL_PATH.exists() else 0
+    except Exception as e:
+        print(f"Failed to replay appeals journal: {e}")
+
+    try:
+        _load_archive_index()
+    except Exception as e:
+        print(f"Failed to load appeals archive index: {e}")
+
+    # an appeals.json from before the archive still holds every finished appeal
+    finished = [(k, ap) for k, ap in loaded.items() if ap.get("status") in TERMINAL_STATUSES]
+    if finished:
+        try:
+            _append_archive(finished)
+            for k, _ in finished:
+                del loaded[k]
+        except Exception as e:
+            print(f"Failed to archive finished appeals: {e}")
+
+    appeals.clear()
+    appeals.update(loaded)
+    _dirty.clear()
+    _archiving.clear()
+    _rebuild_indexes()
+    if finished or _journal_lines >= JOURNAL_COMPACT_LINES:
+        try:
+            _write_snapshot({k: dict(ap) for k, ap in appeals.items()})
+        except Exception as e:
+            print(f"Failed to compact appeals.json: {e}")
@@ -0,0 +1,287 @@
+# PerfectionBot/scripts/bench.py
+#
+# Offline benchmark for the moderation pipeline, no discord connection or network needed.
+#   python -m PerfectionBot.scripts.bench --sizes 100,1000,5000 --lengths 8,32,128
+#   python -m PerfectionBot.scripts.bench --compare data/bench-old.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from wordfreq import iter_wordlist
+
+from PerfectionBot.scripts import filter, leveling
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = BASE_DIR / "data"
+
+LEET = {"a": "4", "e": "3", "i": "1", "o": "0", "s": "5", "t": "7"}
+
+
+def peak_rss_kb() -> int | None:
+    # high water mark of the whole process, only meaningful for the run as a whole
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KiB, macOS reports bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def rss_kb() -> int | None:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss // 1024
+    try:
+        # linux without psutil, second field is resident pages
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    # ru_maxrss only ever rises, so a single run's peak has to be watched while it runs
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.before = rss_kb()
+        self.peak = self.before
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="bench-rss", daemon=True)
+        self._thread.start()
+
+    def _sample(self) -> int | None:
+        now = rss_kb()
+        if now is not None and (self.peak is None or now > self.peak):
+            self.peak = now
+        return now
+
+    def _watch(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+
+    def stop(self) -> tuple[int | None, int | None, int | None]:
+        self._done.set()
+        self._thread.join()
+        return self.before, self.peak, self._sample()
+
+
+def percentile(sorted_vals: list[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+def vocabulary(n: int = 5000) -> list[str]:
+    words = []
+    for w in iter_wordlist("en"):
+        if w.isalpha() and len(w) > 1:
+            words.append(w)
+            if len(words) >= n:
+                break
+    return words
+
+
+def synthetic_blacklist(rng: random.Random, size: int) -> list[str]:
+    # made-up words so the list never overlaps real vocabulary, like most slur lists
+    out = set()
+    while len(out) < size:
+        out.add("".join(rng.choice("bcdfghjklmnpqrstvwxz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4))))
+    return sorted(out)
+
+
+def obfuscate(rng: random.Random, word: str) -> str:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "".join(LEET.get(c, c) for c in word)
+    if kind == 1:
+        cut = rng.randint(1, len(word) - 1)
+        return word[:cut] + " " + word[cut:]
+    if kind == 2:
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    return word.upper()
+
+
+def synthetic_corpus(rng: random.Random, vocab: list[str], bad: list[str], count: int, words: int, bad_ratio: float) -> list[str]:
+    msgs = []
+    for _ in range(count):
+        n = max(1, int(rng.gauss(words, words / 4)))
+        tokens = rng.choices(vocab, k=n)
+        if bad and rng.random() < bad_ratio:
+            tokens[rng.randrange(n)] = obfuscate(rng, rng.choice(bad))
+        msgs.append(" ".join(tokens))
+    return msgs
+
+
+def _timed_run(func, items) -> tuple[list[float], float, list]:
+    lat = []
+    results = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        results.append(func(item))
+        lat.append(time.perf_counter() - t)
+    return lat, time.perf_counter() - start, results
+
+
+def _row(lat: list[float], elapsed: float, extra: dict, mem: RssSampler) -> dict:
+    lat.sort()
+    rss_before, rss_peak, rss_after = mem.stop()
+    return {
+        **extra,
+        "ops_per_s": round(len(lat) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(lat, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(lat, 0.99) * 1000, 4),
+        "max_ms": round(lat[-1] * 1000, 4) if lat else 0.0,
+        # the highest rss seen while this run was going, and what it kept on top of the process before it
+        "run_peak_rss_kb": rss_peak,
+        "rss_delta_kb": rss_after - rss_before if rss_after is not None and rss_before is not None else None
+    }
+
+
+def bench_filter(rng, vocab, sizes, lengths, count, bad_ratio, corpus, cached) -> list[dict]:
+    rows = []
+    if not cached:
+        filter.verdict_cache.maxsize = 0
+    for size in sizes:
+        bad = synthetic_blacklist(rng, size)
+        # the first row of a size also covers building its index
+        mem = RssSampler()
+        t = time.perf_counter()
+        filter.set_blacklist(bad)
+        build_s = time.perf_counter() - t
+        for words in lengths:
+            msgs = corpus or synthetic_corpus(rng, vocab, bad, count, words, bad_ratio)
+            filter.verdict_cache.clear()
+            filter.check_bad(msgs[0])
+            lat, elapsed, results = _timed_run(filter.check_bad, msgs)
+            rows.append(_row(lat, elapsed, {
+                "blacklist_size": size,
+                "message_words": None if corpus else words,
+                "messages": len(msgs),
+                "index_build_s": round(build_s, 4),
+                "flagged": sum(1 for r in results if r)
+            }, mem))
+            mem = RssSampler()
+            print(f"check_bad  size={size:<6} words={words if not corpus else '-':<5} "
+                  f"{rows[-1]['ops_per_s']:>10} msg/s  p50 {rows[-1]['p50_ms']:.3f}ms  p99 {rows[-1]['p99_ms']:.3f}ms")
+            if corpus:
+                break
+        mem.stop()
+    return rows
+
+
+def bench_normalize(rng, vocab, lengths, count) -> list[dict]:
+    rows = []
+    for words in lengths:
+        msgs = synthetic_corpus(rng, vocab, [], count, words, 0)
+        mem = RssSampler()
+        lat, elapsed, _ = _timed_run(filter.normalize, msgs)
+        rows.append(_row(lat, elapsed, {"message_words": words, "messages": len(msgs)}, mem))
+        print(f"normalize  words={words:<5} {rows[-1]['ops_per_s']:>10} msg/s  p99 {rows[-1]['p99_ms']:.4f}ms")
+    return rows
+
+
+def bench_xp(rng, count) -> dict:
+    # same work handle_message_event does per message: bump xp, compare levels
+    mem = RssSampler()
+    table = leveling.XPTable()
+    users = [rng.getrandbits(60) for _ in range(max(1, count // 20))]
+    ups = 0
+
+    def step(uid):
+        nonlocal ups
+        new_xp = table.add(uid, 2)
+        if leveling.convertToLevel(new_xp) > leveling.convertToLevel(new_xp - 2):
+            ups += 1
+
+    lat, elapsed, _ = _timed_run(step, rng.choices(users, k=count))
+    row = _row(lat, elapsed, {"messages": count, "users": len(users)}, mem)
+    row["level_ups"] = ups
+    print(f"xp path    users={len(users):<6} {row['ops_per_s']:>10} msg/s  p99 {row['p99_ms']:.4f}ms")
+    return row
+
+
+def compare(old_path: Path, new: dict):
+    try:
+        with old_path.open("r", encoding="utf-8") as f:
+            old = json.load(f)
+    except Exception as e:
+        print(f"[bench] can't read {old_path}: {e}")
+        return
+    print(f"\nvs {old_path.name} (ratio new/old, above 1 means faster)")
+    old_rows = {(r["blacklist_size"], r["message_words"]): r for r in old.get("filter", [])}
+    for r in new["filter"]:
+        o = old_rows.get((r["blacklist_size"], r["message_words"]))
+        if o and o.get("ops_per_s"):
+            print(f"check_bad  size={r['blacklist_size']:<6} words={r['message_words']}: "
+                  f"{r['ops_per_s'] / o['ops_per_s']:.2f}x  p99 {o['p99_ms']:.3f} -> {r['p99_ms']:.3f}ms")
+    o, r = old.get("xp"), new["xp"]
+    if o and o.get("ops_per_s"):
+        print(f"xp path: {r['ops_per_s'] / o['ops_per_s']:.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark check_bad, normalize and the XP path without discord.")
+    parser.add_argument("--sizes", default="100,1000,5000", help="comma separated blacklist sizes")
+    parser.add_argument("--lengths", default="8,32,128", help="comma separated average words per message")
+    parser.add_argument("--messages", type=int, default=2000, help="messages per run")
+    parser.add_argument("--bad-ratio", type=float, default=0.05, help="share of messages carrying an obfuscated blacklisted word")
+    parser.add_argument("--corpus", type=Path, help="replay this file (one message per line) instead of synthetic messages")
+    parser.add_argument("--cached", action="store_true", help="keep the verdict cache on, repeats in the corpus then hit it")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", type=Path, help="where to write the json results (default data/bench-<time>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    lengths = [int(x) for x in args.lengths.split(",") if x.strip()]
+    corpus = None
+    if args.corpus:
+        with args.corpus.open("r", encoding="utf-8") as f:
+            corpus = [ln.rstrip("\n") for ln in f if ln.strip()]
+
+    vocab = vocabulary()
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "nlp_mode": filter.NLP_MODE,
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+        },
+        "normalize": bench_normalize(rng, vocab, lengths, args.messages),
+        "xp": bench_xp(rng, args.messages * 10),
+        "filter": bench_filter(rng, vocab, sizes, lengths, args.messages, args.bad_ratio, corpus, args.cached)
+    }
+    results["meta"]["peak_rss_kb"] = peak_rss_kb()
+
+    out = args.out or DATA_DIR / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {out}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
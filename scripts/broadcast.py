@@ -0,0 +1,298 @@
+# PerfectionBot/scripts/broadcast.py
+
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import discord
+
+from PerfectionBot.config.yamlHandler import get_value
+from PerfectionBot.scripts.log import log_to_channel
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = BASE_DIR / "data"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+DM_FAILED_FILE = DATA_DIR / "dm_failed.dat"
+
+MAX_CONCURRENCY = int(get_value("behaviour", "broadcast", "MAX_CONCURRENCY", default=8))
+CHECKPOINT_INTERVAL = float(get_value("behaviour", "broadcast", "CHECKPOINT_INTERVAL", default=10))
+REPORT_INTERVAL = 10
+
+_jobs: dict[int, "BroadcastJob"] = {}
+_failed_ids: set[int] | None = None
+
+
+def _checkpoint_path(guild_id: int) -> Path:
+    return DATA_DIR / f"broadcast-{guild_id}.json"
+
+
+def _load_failed_ids() -> set[int]:
+    global _failed_ids
+    if _failed_ids is None:
+        _failed_ids = set()
+        if DM_FAILED_FILE.exists():
+            try:
+                with DM_FAILED_FILE.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line.isdigit():
+                            _failed_ids.add(int(line))
+            except Exception as e:
+                print(f"[broadcast] failed to read {DM_FAILED_FILE.name}: {e}")
+    return _failed_ids
+
+
+def _append_failed_ids(ids: list[int]):
+    try:
+        with DM_FAILED_FILE.open("a", encoding="utf-8") as f:
+            f.write("".join(f"{uid}\n" for uid in ids))
+    except Exception as e:
+        print(f"[broadcast] failed to write {DM_FAILED_FILE.name}: {e}")
+
+
+class BroadcastJob:
+    def __init__(self, guild_id: int, author_id: int, body: str, targets: list[int], cursor: int = 0,
+                 sent: int = 0, failed: int = 0, skipped: int = 0, completed: set[int] | None = None):
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.body = body
+        self.targets = targets
+        # every index below cursor is finished, completed holds the finished ones above it
+        self.cursor = cursor
+        self.completed = completed or set()
+        self.sent = sent
+        self.failed = failed
+        self.skipped = skipped
+        self.window = 1
+        self.task: asyncio.Task | None = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.skipped
+
+    def complete(self, idx: int):
+        self.completed.add(idx)
+        while self.cursor in self.completed:
+            self.completed.discard(self.cursor)
+            self.cursor += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "guild_id": self.guild_id,
+            "author_id": self.author_id,
+            "body": self.body,
+            "targets": self.targets,
+            "cursor": self.cursor,
+            "completed": sorted(self.completed),
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped": self.skipped
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BroadcastJob":
+        return cls(
+            int(data["guild_id"]), int(data["author_id"]), data["body"], [int(t) for t in data["targets"]],
+            int(data.get("cursor", 0)), int(data.get("sent", 0)), int(data.get("failed", 0)), int(data.get("skipped", 0)),
+            {int(i) for i in data.get("completed", [])}
+        )
+
+    def summary(self) -> str:
+        return f"Sent: {self.sent}, Failed: {self.failed}, Skipped: {self.skipped}"
+
+
+async def _save_checkpoint(job: BroadcastJob):
+    data = job.to_dict()
+
+    def _write():
+        path = _checkpoint_path(job.guild_id)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(path)
+    try:
+        await asyncio.to_thread(_write)
+    except Exception as e:
+        print(f"[broadcast] checkpoint failed: {e}")
+
+
+def _clear_checkpoint(guild_id: int):
+    try:
+        _checkpoint_path(guild_id).unlink(missing_ok=True)
+    except Exception as e:
+        print(f"[broadcast] failed to remove checkpoint: {e}")
+
+
+async def _send(guild: discord.Guild, uid: int, body: str):
+    member = guild.get_member(uid)
+    if member is None:
+        return "skipped", 0.0
+    try:
+        await member.send(body)
+        return "sent", 0.0
+    except discord.Forbidden:
+        return "closed", 0.0
+    except discord.HTTPException as e:
+        if e.status == 429:
+            return "ratelimited", float(getattr(e, "retry_after", None) or 1.0)
+        return "failed", 0.0
+    except Exception:
+        return "failed", 0.0
+
+
+async def _run(job: BroadcastJob, guild: discord.Guild, report):
+    failed_ids = _load_failed_ids()
+    new_failed = []
+    retry: list[int] = []
+    inflight: dict[asyncio.Task, int] = {}
+    next_idx = job.cursor
+    resume_at = 0.0
+    streak = 0
+    last_checkpoint = last_report = time.monotonic()
+
+    def settle(task: asyncio.Task):
+        nonlocal resume_at, streak
+        idx = inflight.pop(task)
+        outcome, retry_after = task.result()
+        if outcome == "ratelimited":
+            # multiplicative decrease on 429, the window grows back one slot per full window of successes
+            job.window = max(1, job.window // 2)
+            streak = 0
+            resume_at = time.monotonic() + retry_after
+            retry.append(idx)
+            return
+        if outcome == "sent":
+            job.sent += 1
+            streak += 1
+            if streak >= job.window:
+                job.window = min(MAX_CONCURRENCY, job.window + 1)
+                streak = 0
+        elif outcome == "skipped":
+            job.skipped += 1
+        else:
+            job.failed += 1
+            if outcome == "closed":
+                uid = job.targets[idx]
+                failed_ids.add(uid)
+                new_failed.append(uid)
+        job.complete(idx)
+
+    try:
+        while next_idx < len(job.targets) or inflight or retry:
+            now = time.monotonic()
+            if now < resume_at and not inflight:
+                await asyncio.sleep(resume_at - now)
+            while now >= resume_at and len(inflight) < job.window and (retry or next_idx < len(job.targets)):
+                if retry:
+                    idx = retry.pop()
+                else:
+                    idx = next_idx
+                    next_idx += 1
+                    if idx < job.cursor or idx in job.completed:
+                        # finished before a restart, already counted in the checkpoint
+                        continue
+                    if job.targets[idx] in failed_ids:
+                        job.skipped += 1
+                        job.complete(idx)
+                        continue
+                task = asyncio.create_task(_send(guild, job.targets[idx], job.body))
+                inflight[task] = idx
+            if not inflight:
+                continue
+
+            done, _ = await asyncio.wait(inflight.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                settle(task)
+
+            now = time.monotonic()
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                last_checkpoint = now
+                if new_failed:
+                    await asyncio.to_thread(_append_failed_ids, new_failed)
+                    new_failed = []
+                await _save_checkpoint(job)
+            if report and now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                try:
+                    await report(job, False)
+                except Exception:
+                    pass
+    except BaseException:
+        # DMs already handed to discord still land, wait for them so the checkpoint doesn't send them twice
+        if inflight:
+            done, _ = await asyncio.wait(list(inflight))
+            for task in done:
+                settle(task)
+        raise
+    finally:
+        if new_failed:
+            await asyncio.to_thread(_append_failed_ids, new_failed)
+
+
+async def _job_main(job: BroadcastJob, guild: discord.Guild, report):
+    try:
+        await _run(job, guild, report)
+    except asyncio.CancelledError:
+        await _save_checkpoint(job)
+        raise
+    except Exception as e:
+        print(f"[broadcast] job for guild {job.guild_id} crashed, checkpoint kept: {e}")
+        await _save_checkpoint(job)
+        return
+    finally:
+        _jobs.pop(job.guild_id, None)
+
+    _clear_checkpoint(job.guild_id)
+    if report:
+        try:
+            await report(job, True)
+        except Exception:
+            pass
+    asyncio.create_task(log_to_channel(
+        guild,
+        f"✉️ <@{job.author_id}> broadcasted a DM to the guild. {job.summary()}",
+        discord.Color.blurple(),
+        "dm"
+    ))
+
+
+def running(guild_id: int) -> BroadcastJob | None:
+    return _jobs.get(guild_id)
+
+
+async def start(guild: discord.Guild, author: discord.abc.User, body: str, report=None) -> BroadcastJob | None:
+    if guild.id in _jobs:
+        return None
+    targets = [m.id for m in guild.members if not m.bot]
+    job = BroadcastJob(guild.id, author.id, body, targets)
+    _jobs[guild.id] = job
+    await _save_checkpoint(job)
+    job.task = asyncio.create_task(_job_main(job, guild, report))
+    return job
+
+
+async def resume_pending(bot: discord.Client):
+    for path in DATA_DIR.glob("broadcast-*.json"):
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                job = BroadcastJob.from_dict(json.load(f))
+        except Exception as e:
+            print(f"[broadcast] unreadable checkpoint {path.name}: {e}")
+            continue
+        if job.guild_id in _jobs:
+            continue
+        guild = bot.get_guild(job.guild_id)
+        if not guild:
+            continue
+
+        async def _report_by_dm(j: BroadcastJob, final: bool, g=guild):
+            if not final:
+                return
+            user = bot.get_user(j.author_id) or await bot.fetch_user(j.author_id)
+            await user.send(f"✅ Resumed DM broadcast in **{g.name}** complete. {j.summary()}.")
+
+        _jobs[job.guild_id] = job
+        job.task = asyncio.create_task(_job_main(job, guild, _report_by_dm))
+        print(f"[broadcast] resumed broadcast for guild {job.guild_id} at {job.cursor}/{len(job.targets)}")
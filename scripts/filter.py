@@ -1,18 +1,48 @@
 #filter
 
+import os
 import re
+import sys
+import threading
+import time
 import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from itertools import combinations
-from rapidfuzz import fuzz, distance
-from wordfreq import zipf_frequency
+from rapidfuzz import fuzz
+from wordfreq import zipf_frequency, iter_wordlist
 import spacy
-from PerfectionBot.config.yamlHandler import get_value
+from PerfectionBot.config.yamlHandler import get_value, banned_keywords_path as CONFIG_PATH
+from PerfectionBot.scripts.matcher import BlacklistIndex
+from PerfectionBot.scripts.metrics import timed
 
-CONFIG_PATH = Path(__file__).parents[1] / "config" / "banned-keywords.config"
+BASE_DIR = Path(__file__).parents[1]
+COMBO_WINDOW = int(get_value("behaviour", "filter", "COMBO_WINDOW", default=3))
+MAX_CHECKS = int(get_value("behaviour", "filter", "MAX_CHECKS", default=2000))
+MAX_INPUT = int(get_value("behaviour", "filter", "MAX_INPUT", default=2000))
+WORD_CACHE_SIZE = int(get_value("behaviour", "filter", "WORD_CACHE_SIZE", default=50000))
+VALID_WORDS_FILE = BASE_DIR / str(get_value("behaviour", "filter", "VALID_WORDS_FILE", default="data/valid-words.txt"))
+VERDICT_CACHE_SIZE = int(get_value("behaviour", "filter", "VERDICT_CACHE_SIZE", default=5000))
+VERDICT_CACHE_TTL = float(get_value("behaviour", "filter", "VERDICT_CACHE_TTL", default=300))
+NLP_MODE = str(get_value("behaviour", "filter", "NLP_MODE", default="light")).strip().lower()
 SAFE_SUBSTRINGS = ["pass", "classic", "assignment", "class", "glass", "nagger", "dagger", "cam", "come", "where", "ore", "hoe", "grape", "whose", "who"]
 
-nlp = spacy.load("en_core_web_sm")
+def _load_nlp(mode: str):
+    if mode == "lookup":
+        try:
+            pipeline = spacy.blank("en")
+            pipeline.add_pipe("lemmatizer", config={"mode": "lookup"})
+            pipeline.initialize()
+            return pipeline
+        except Exception as e:
+            print(f"[filter] lookup lemmatizer unavailable, using light pipeline: {e}")
+            mode = "light"
+    if mode == "light":
+        # we only read lemma_ and is_stop, the rule lemmatizer needs POS tags but no parser or NER
+        return spacy.load("en_core_web_sm", exclude=["parser", "ner", "senter"])
+    return spacy.load("en_core_web_sm")
+
+nlp = _load_nlp(NLP_MODE)
 
 def load_blacklist() -> list[str]:
     words = []
@@ -37,64 +67,234 @@ def normalize(text: str) -> str:
     text = re.sub(r'[^a-z0-9]+', ' ', text.lower())
     return text.strip()
 
+def load_valid_words(path: Path = VALID_WORDS_FILE) -> frozenset[str]:
+    if not path.exists():
+        return frozenset()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return frozenset(line.strip() for line in f if line.strip())
+    except Exception as e:
+        print(f"[filter] failed to load {path}: {e}")
+        return frozenset()
+
+def build_valid_words(path: Path = VALID_WORDS_FILE) -> int:
+    words = sorted({w for w in iter_wordlist("en", "best") if w.isascii() and w.isalpha()})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(words) + "\n")
+    return len(words)
+
+valid_words = load_valid_words()
+
+def _known(word: str) -> bool:
+    if valid_words:
+        return word in valid_words
+    return zipf_frequency(word, "en") > 0.0
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
 def is_valid_word(word: str) -> bool:
-    freq = zipf_frequency(word, "en")
-    if freq > 0.0:
+    if _known(word):
         return True
     common_suffixes = ["s", "es", "ed", "ing", "er", "ly"]
     for suffix in common_suffixes:
         if word.endswith(suffix) and len(word) > len(suffix) + 2:
             base = word[:-len(suffix)]
-            base_freq = zipf_frequency(base, "en")
-            if base_freq > 0.0:
+            if _known(base):
                 return True
             if suffix in ["ed", "ing"] and len(base) > 2 and base[-1] == base[-2]:
-                base2 = base[:-1]
-                base2_freq = zipf_frequency(base2, "en")
-                if base2_freq > 0.0:
+                if _known(base[:-1]):
                     return True
     return False
 
-blacklist = load_blacklist()
-blacklist_normalized = [normalize(w) for w in blacklist]
+def word_cache_stats() -> dict:
+    info = is_valid_word.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+class VerdictCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+verdict_cache = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+
+def cache_stats() -> dict:
+    verdicts, words = verdict_cache.stats(), word_cache_stats()
+    return {
+        "verdict_hits": verdicts["hits"],
+        "verdict_misses": verdicts["misses"],
+        "verdict_size": verdicts["size"],
+        "word_hits": words["hits"],
+        "word_misses": words["misses"],
+        "word_size": words["size"]
+    }
+
+blacklist: list[str] = []
+blacklist_normalized: list[str] = []
+_index: BlacklistIndex | None = None
+_index_mtime = None
+
+def _config_mtime():
+    try:
+        return os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def set_blacklist(words: list[str]):
+    global blacklist, blacklist_normalized, _index
+    normalized = [normalize(w) for w in words]
+    version = _index.version + 1 if _index is not None else 0
+    _index = BlacklistIndex(normalized, version=version)
+    blacklist, blacklist_normalized = list(words), normalized
+    verdict_cache.clear()
+
+def reload_blacklist(force: bool = False) -> bool:
+    global _index_mtime
+    mtime = _config_mtime()
+    if not force and _index is not None and mtime == _index_mtime:
+        return False
+    set_blacklist(load_blacklist())
+    _index_mtime = mtime
+    return True
+
+reload_blacklist()
+
+def _tokens(doc) -> list[str]:
+    return [t.lemma_ for t in doc if not t.is_stop]
 
+def _adjacent_windows(tokens: list[str], size: int, max_len: int):
+    # only neighbouring tokens are joined, that is where split-word evasion happens
+    for i in range(len(tokens)):
+        combined = tokens[i]
+        for j in range(i + 1, min(i + size, len(tokens))):
+            combined += tokens[j]
+            if len(combined) > max_len:
+                break
+            yield i, combined
+
+def _split_input(nm: str) -> tuple[str, list[str]]:
+    # spaCy only sees the head of an oversized message, the words past it are still matched exactly
+    if len(nm) <= MAX_INPUT:
+        return nm, []
+    cut = nm.rfind(" ", 0, MAX_INPUT + 1)
+    if cut <= 0:
+        cut = MAX_INPUT
+    return nm[:cut], nm[cut:].split()
+
+@timed("check_bad")
 def check_bad(message: str, threshold: int = None, max_edits: int = 1) -> dict | None:
     if threshold is None:
         threshold = get_value("behaviour", "filter", "DETECTION_THRESHOLD")
 
+    index = _index
     nm = normalize(message)
-    doc = nlp(nm)
-    tokens = [t.lemma_ for t in doc if not t.is_stop]
-    flagged_words = []
+    key = (nm, threshold, max_edits, index.version)
+    cached = verdict_cache.get(key)
+    if cached is not None:
+        return dict(cached[1]) if cached[1] else None
+
+    head, tail = _split_input(nm)
+    verdict = _evaluate(index, _tokens(nlp(head)), threshold, max_edits, tail)
+    verdict_cache.put(key, verdict)
+    return dict(verdict) if verdict else None
+
+@timed("check_bad_batch")
+def check_bad_batch(messages: list[str], threshold: int = None, max_edits: int = 1) -> list[dict | None]:
+    if threshold is None:
+        threshold = get_value("behaviour", "filter", "DETECTION_THRESHOLD")
+
+    index = _index
+    keys = [(normalize(m), threshold, max_edits, index.version) for m in messages]
+    verdicts = {}
+    todo = []
+    for key in keys:
+        if key in verdicts:
+            continue
+        cached = verdict_cache.get(key)
+        if cached is not None:
+            verdicts[key] = cached[1]
+        else:
+            verdicts[key] = None
+            todo.append(key)
+
+    # one pipe() call over the batch is much cheaper per doc than calling nlp() per message
+    parts = [_split_input(k[0]) for k in todo]
+    docs = nlp.pipe([head for head, _ in parts], batch_size=max(1, len(todo)))
+    for key, (_, tail), doc in zip(todo, parts, docs):
+        verdict = _evaluate(index, _tokens(doc), threshold, max_edits, tail)
+        verdict_cache.put(key, verdict)
+        verdicts[key] = verdict
+
+    return [dict(verdicts[k]) if verdicts[k] else None for k in keys]
+
+def _evaluate(index: BlacklistIndex, tokens: list[str], threshold: int, max_edits: int, tail: list[str] = ()) -> dict | None:
+    words = tokens + list(tail)
+    flagged_words = index.phrase_hits(words)
+    # every token and window visited costs one check, once MAX_CHECKS is spent (or for the tail past
+    # MAX_INPUT) the rest is only matched exactly, which is a set lookup per window
+    budget = MAX_CHECKS
 
     for w in tokens:
-        if w in blacklist_normalized:
-            flagged_words.append(w)
+        budget -= 1
+        if budget < 0:
+            break
+        if w in index.exact:
             continue
         if is_valid_word(w) or len(w) <= 3:
             continue
-        for nb in blacklist_normalized:
-            score = fuzz.ratio(w, nb)
-            if score >= threshold and distance.Levenshtein.distance(w, nb) <= max_edits:
+        for nb in index.fuzzy(w, max_edits):
+            if fuzz.ratio(w, nb) >= threshold:
                 flagged_words.append(nb)
 
-    for r in range(2, 4):
-        for combo in combinations(tokens, r):
-            combined = ''.join(combo)
-            if any(safe in combined for safe in SAFE_SUBSTRINGS):
-                continue
-            for nb in blacklist_normalized:
-                if len(nb) != len(combined):
-                    continue
-                if combined == nb:
-                    flagged_words.append(nb)
-                    continue
-                if is_valid_word(combined) or len(combined) <= 3:
-                    continue
-                score = fuzz.ratio(combined, nb)
-                if score >= threshold and distance.Levenshtein.distance(combined, nb) <= max_edits:
-                    flagged_words.append(nb)
+    for i, combined in _adjacent_windows(words, COMBO_WINDOW, index.max_len):
+        budget -= 1
+        if any(safe in combined for safe in SAFE_SUBSTRINGS):
+            continue
+        if combined in index.exact:
+            flagged_words.append(combined)
+            continue
+        if budget < 0 or i >= len(tokens):
+            continue
+        if is_valid_word(combined) or len(combined) <= 3:
+            continue
+        for nb in index.fuzzy(combined, max_edits):
+            if len(nb) == len(combined) and fuzz.ratio(combined, nb) >= threshold:
+                flagged_words.append(nb)
 
     if flagged_words:
         return {"word": flagged_words[0]}
-    return None
\ No newline at end of file
+    return None
+
+if __name__ == "__main__" and "--build-words" in sys.argv:
+    print(f"Wrote {build_valid_words()} words to {VALID_WORDS_FILE}")
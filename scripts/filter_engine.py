@@ -0,0 +1,282 @@
+# PerfectionBot/scripts/filter_engine.py
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PerfectionBot.config.yamlHandler import get_value
+from PerfectionBot.scripts.metrics import timed, gauge, registry
+
+ENGINE = str(get_value("behaviour", "filter", "ENGINE", default="thread")).strip().lower()
+WORKERS = int(get_value("behaviour", "filter", "WORKERS", default=0)) or None
+QUEUE_SIZE = int(get_value("behaviour", "filter", "QUEUE_SIZE", default=256))
+TIMEOUT = float(get_value("behaviour", "filter", "TIMEOUT", default=5))
+BATCH_SIZE = int(get_value("behaviour", "filter", "BATCH_SIZE", default=32))
+BATCH_WINDOW = float(get_value("behaviour", "filter", "BATCH_WINDOW_MS", default=5)) / 1000
+WORKER_RELOAD_INTERVAL = 60
+
+_worker_last_reload = 0.0
+
+
+def _worker_init():
+    global _worker_last_reload
+    # importing the filter loads the spaCy model and compiles the blacklist once per worker
+    from PerfectionBot.scripts import filter
+    filter.reload_blacklist()
+    _worker_last_reload = time.monotonic()
+
+
+def _maybe_reload_worker():
+    global _worker_last_reload
+    from PerfectionBot.scripts import filter
+    now = time.monotonic()
+    if now - _worker_last_reload >= WORKER_RELOAD_INTERVAL:
+        _worker_last_reload = now
+        try:
+            filter.reload_blacklist()
+        except Exception as e:
+            print(f"[filter_engine] worker blacklist reload failed: {e}")
+
+
+# worker results carry (pid, cache stats) so the main process can see caches that only exist in the workers
+def _worker_check(content: str):
+    from PerfectionBot.scripts import filter
+    _maybe_reload_worker()
+    result = filter.check_bad(content)
+    return os.getpid(), filter.cache_stats(), result
+
+
+def _worker_check_batch(contents: list[str]):
+    from PerfectionBot.scripts import filter
+    _maybe_reload_worker()
+    results = filter.check_bad_batch(contents)
+    return os.getpid(), filter.cache_stats(), results
+
+
+def _thread_check(content: str):
+    from PerfectionBot.scripts import filter
+    return filter.check_bad(content)
+
+
+def _thread_check_batch(contents: list[str]):
+    from PerfectionBot.scripts import filter
+    return filter.check_bad_batch(contents)
+
+
+_pending_gauge = gauge("filter_pending")
+
+
+class Unverified:
+    # returned when the filter could not answer in time; the message is not cleared, future holds the late verdict
+    __slots__ = ("future",)
+
+    def __init__(self, future):
+        self.future = future
+
+
+class FilterEngine:
+    def __init__(self, mode: str = ENGINE, workers: int | None = WORKERS, queue_size: int = QUEUE_SIZE, timeout: float = TIMEOUT, batch_size: int = BATCH_SIZE, batch_window: float = BATCH_WINDOW):
+        self.mode = mode if mode in ("thread", "process") else "thread"
+        self.workers = workers
+        self.queue_size = max(1, queue_size)
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.pending = 0
+        self.timeouts = 0
+        self.batches = 0
+        self._executor = None
+        self._slots = asyncio.Semaphore(self.queue_size)
+        self._batch: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        self._worker_stats: dict[int, dict] = {}
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="filter")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _restart(self, reason, executor):
+        # several batches fail together when a pool breaks, only the first one replaces it
+        if executor is not self._executor:
+            return
+        print(f"[filter_engine] worker pool broke, restarting: {reason}")
+        self.shutdown()
+        self._worker_stats.clear()
+        self.start()
+
+    def _unwrap(self, reply):
+        if self.mode != "process":
+            return reply
+        pid, stats, result = reply
+        self._worker_stats[pid] = stats
+        return result
+
+    async def _run_one(self, func, content: str):
+        loop = asyncio.get_running_loop()
+        return self._unwrap(await loop.run_in_executor(self._executor, func, content))
+
+    def _submit_one(self, content: str) -> asyncio.Future:
+        if self.mode == "process":
+            return asyncio.ensure_future(self._run_one(_worker_check, content))
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, _thread_check, content)
+
+    def _enqueue(self, content: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._batch.append((content, fut))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return fut
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        self.batches += 1
+        loop = asyncio.get_running_loop()
+        func = _worker_check_batch if self.mode == "process" else _thread_check_batch
+        executor = self._executor
+        try:
+            work = loop.run_in_executor(executor, func, [c for c, _ in batch])
+        except Exception as e:
+            self._resolve(batch, executor, None, e)
+            return
+        work.add_done_callback(lambda f: self._resolve(batch, executor, f, None))
+
+    def _resolve(self, batch, executor, work, error):
+        results = None
+        if error is None:
+            if work.cancelled():
+                # cancel_futures on a pool shutdown, a plain error so it can't cancel whoever awaits it
+                error = RuntimeError("filter batch cancelled")
+            else:
+                error = work.exception()
+                if error is None:
+                    results = self._unwrap(work.result())
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                self._restart(error, executor)
+            else:
+                print(f"[filter_engine] batch failed: {error!r}")
+            # no verdict is not a clean verdict, the waiting checks see the error and re-check
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(error)
+            return
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def _release_after(self, futs: list):
+        # the slot stays taken until the executor is really done with this message
+        pending = [f for f in futs if not f.done()]
+        if not pending:
+            self._slots.release()
+            return
+        done = asyncio.gather(*pending, return_exceptions=True)
+        done.add_done_callback(lambda _: self._slots.release())
+
+    async def _recheck(self, content: str) -> dict | None:
+        hit = await self._check(content, retry=False)
+        if isinstance(hit, Unverified):
+            hit = await hit.future
+        return hit
+
+    @timed("filter_check")
+    async def check(self, content: str) -> "dict | Unverified | None":
+        return await self._check(content, retry=True)
+
+    async def _check(self, content: str, retry: bool) -> "dict | Unverified | None":
+        self.start()
+        # waiting for a slot is the backpressure, a flood queues here instead of piling up in the pool
+        await self._slots.acquire()
+        self.pending += 1
+        _pending_gauge.set(self.pending)
+        fut = None
+        executor = self._executor
+        try:
+            fut = self._enqueue(content) if self.batch_size > 1 else self._submit_one(content)
+            # shielded so a timeout leaves the work running, its verdict still lands on the Unverified
+            return await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"[filter_engine] check timed out after {self.timeout}s, verdict deferred")
+            return Unverified(fut)
+        except asyncio.CancelledError:
+            # the pool was shut down under this check, the caller itself wasn't cancelled
+            if fut is None or not fut.cancelled():
+                raise
+            if not retry:
+                raise RuntimeError("filter check cancelled")
+            return Unverified(asyncio.ensure_future(self._recheck(content)))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._restart(e, executor)
+            if not retry:
+                raise
+            # the worker failed rather than answered, run the message once more once the slot is free
+            return Unverified(asyncio.ensure_future(self._recheck(content)))
+        finally:
+            self.pending -= 1
+            _pending_gauge.set(self.pending)
+            self._release_after([fut] if fut is not None else [])
+
+    def reload_blacklist(self) -> bool:
+        # process workers reread the blacklist themselves every WORKER_RELOAD_INTERVAL
+        if self.mode == "process":
+            return False
+        from PerfectionBot.scripts import filter
+        return filter.reload_blacklist()
+
+    def cache_stats(self) -> dict:
+        if self.mode == "process":
+            totals: dict[str, int] = {}
+            for stats in list(self._worker_stats.values()):
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+            return totals
+        # thread mode shares the filter module, but don't be the one to import it (and spaCy)
+        filter = sys.modules.get("PerfectionBot.scripts.filter")
+        return filter.cache_stats() if filter else {}
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pending": self.pending,
+            "queue_size": self.queue_size,
+            "timeouts": self.timeouts,
+            "batches": self.batches,
+            "cache": self.cache_stats()
+        }
+
+
+engine = FilterEngine()
+
+
+@registry.collector
+def _export_cache_stats():
+    for key, value in engine.cache_stats().items():
+        gauge(f"filter_{key}").set(value)
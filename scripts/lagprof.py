@@ -0,0 +1,148 @@
+# PerfectionBot/scripts/lagprof.py
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from PerfectionBot.config.yamlHandler import get_value
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    THRESHOLD = float(get_value("watchdog", "lag_threshold_ms")) / 1000
+except Exception:
+    THRESHOLD = 0.25
+BEAT_INTERVAL = 0.05
+POLL_INTERVAL = 0.05
+BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, float("inf"))
+STACK_DEPTH = 12
+
+
+def bucket_label(i: int) -> str:
+    if BUCKETS[i] == float("inf"):
+        return f">{BUCKETS[i - 1]:g}s"
+    return f"≤{BUCKETS[i]:g}s"
+
+
+class Site:
+    __slots__ = ("name", "count", "total", "worst", "hist", "stack")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.hist = [0] * len(BUCKETS)
+        self.stack: list[str] = []
+
+    def record(self, duration: float, stack: list[str]):
+        self.count += 1
+        self.total += duration
+        if duration >= self.worst:
+            self.worst = duration
+            self.stack = stack
+        for i, edge in enumerate(BUCKETS):
+            if duration <= edge:
+                self.hist[i] += 1
+                break
+
+
+def _call_site(frames: traceback.StackSummary) -> str:
+    # the innermost frame in our own code names the stall, library frames below it are just where it ended up
+    for fs in reversed(frames):
+        if fs.filename.startswith(PROJECT_DIR):
+            return f"{fs.name} ({os.path.relpath(fs.filename, PROJECT_DIR)}:{fs.lineno})"
+    if frames:
+        fs = frames[-1]
+        return f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+    return "unknown"
+
+
+class LagProfiler:
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self.sites: dict[str, Site] = {}
+        self.hist = [0] * len(BUCKETS)
+        self.stalls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        loop.call_soon(self._heartbeat)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="lag-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self):
+        self._beat = time.perf_counter()
+        if not self._stop.is_set():
+            self._loop.call_later(BEAT_INTERVAL, self._heartbeat)
+
+    def _capture(self) -> tuple[str, list[str]]:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return "unknown", []
+        frames = traceback.extract_stack(frame)
+        del frame
+        stack = [f"{os.path.basename(fs.filename)}:{fs.lineno} {fs.name}" for fs in frames[-STACK_DEPTH:]]
+        return _call_site(frames), stack
+
+    def _watch(self):
+        stall = None
+        while not self._stop.wait(POLL_INTERVAL):
+            if self._loop is None or self._loop.is_closed():
+                return
+            gap = time.perf_counter() - self._beat - BEAT_INTERVAL
+            if gap >= self.threshold:
+                if stall is None:
+                    site, stack = self._capture()
+                    stall = {"beat": self._beat, "site": site, "stack": stack, "gap": gap}
+                else:
+                    stall["gap"] = gap
+            elif stall is not None and self._beat != stall["beat"]:
+                self._finish(stall)
+                stall = None
+
+    def _finish(self, stall: dict):
+        duration = stall["gap"]
+        with self._lock:
+            self.stalls += 1
+            site = self.sites.get(stall["site"])
+            if site is None:
+                site = self.sites[stall["site"]] = Site(stall["site"])
+            site.record(duration, stall["stack"])
+            for i, edge in enumerate(BUCKETS):
+                if duration <= edge:
+                    self.hist[i] += 1
+                    break
+        print(f"⚠️ Event loop lag detected: {duration:.3f}s in {stall['site']}")
+
+    def top(self, n: int = 5, by: str = "total") -> list[Site]:
+        with self._lock:
+            sites = list(self.sites.values())
+        return sorted(sites, key=lambda s: getattr(s, by), reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self.sites.clear()
+            self.hist = [0] * len(BUCKETS)
+            self.stalls = 0
+
+
+profiler = LagProfiler()
@@ -1,7 +1,13 @@
 # PerfectionBot/scripts/leveling.py
 
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
 from pathlib import Path
 import os
+import threading
+import time
+import discord
 from PerfectionBot.config.yamlHandler import get_value
 
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -12,6 +18,7 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 
 FILE = DATA_DIR / "xp.dat"
+JOURNAL = DATA_DIR / "xp.journal"
 ROLE_CONF = CONFIG_DIR / "lvl.config"
 
 BASE_XP = int(get_value("LEVELING", "BASE_XP"))
@@ -21,78 +28,263 @@ MAX_LEVEL = 1000
 XP_INCREMENTS = [20, 35, 40]
 XP_EXTRA_STEP = 20
 
+JOURNAL_COMPACT_LINES = 5000
+SYNC_CONCURRENCY = int(get_value("LEVELING", "SYNC_CONCURRENCY", default=4))
+LEGACY_GUILD = 0
+
+
+class XPTable:
+    # sorted user ids with a parallel xp column, ~16 bytes per member instead of a dict entry plus two int objects
+    __slots__ = ("ids", "xp")
+
+    def __init__(self, entries: dict[int, int] | None = None):
+        self.ids = array("Q")
+        self.xp = array("q")
+        if entries:
+            for uid in sorted(entries):
+                self.ids.append(uid)
+                self.xp.append(entries[uid])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, uid: int):
+        i = bisect_left(self.ids, uid)
+        return i < len(self.ids) and self.ids[i] == uid
+
+    def get(self, uid: int, default: int = 0) -> int:
+        i = bisect_left(self.ids, uid)
+        if i < len(self.ids) and self.ids[i] == uid:
+            return self.xp[i]
+        return default
+
+    def set(self, uid: int, value: int):
+        i = bisect_left(self.ids, uid)
+        if i < len(self.ids) and self.ids[i] == uid:
+            self.xp[i] = value
+        else:
+            self.ids.insert(i, uid)
+            self.xp.insert(i, value)
+
+    def add(self, uid: int, amount: int) -> int:
+        value = self.get(uid) + amount
+        self.set(uid, value)
+        return value
+
+    def items(self):
+        return zip(self.ids, self.xp)
+
+    def copy(self) -> "XPTable":
+        t = XPTable()
+        t.ids = array("Q", self.ids)
+        t.xp = array("q", self.xp)
+        return t
+
+
+ROLE_RECHECK_INTERVAL = 30
+
+_roles: list[tuple[int, int]] | None = None
+_role_levels: list[int] = []
+_role_ids: list[int] = []
+_reward_role_ids: frozenset[int] = frozenset()
+_role_level_of: dict[int, int] = {}
+_roles_mtime = None
+_roles_checked = 0.0
+
+_xp: dict[int, XPTable] = {}
+_loaded = False
+_journal_lines = 0
+_dirty: set[tuple[int, int]] = set()
+_lock = threading.RLock()
+
 def ensure_file():
     FILE.parent.mkdir(parents=True, exist_ok=True)
     FILE.touch(exist_ok=True)
 
-def read_xp(id: int) -> int:
-    ensure_file()
-    with FILE.open("r", encoding="utf-8") as f:
+def _parse_xp_line(line: str):
+    line = line.strip()
+    if not line or ":" not in line:
+        return None
+    parts = line.split(":")
+    try:
+        if len(parts) >= 3:
+            gid, uid, raw = int(parts[0]), int(parts[1]), parts[2]
+        else:
+            # id:xp lines predate per-guild storage
+            gid, uid, raw = LEGACY_GUILD, int(parts[0]), parts[1]
+    except ValueError:
+        return None
+    try:
+        return gid, uid, int(raw)
+    except ValueError:
+        return gid, uid, 0
+
+def _read_entries(path: Path, into: dict[int, dict[int, int]]) -> int:
+    count = 0
+    with path.open("r", encoding="utf-8") as f:
         for line in f:
-            line = line.strip()
-            if not line or ":" not in line:
-                continue
-            parts = line.split(":")
-            if parts[0] == str(id):
-                try:
-                    return int(parts[1])
-                except ValueError:
-                    return 0
-    return 0
+            entry = _parse_xp_line(line)
+            if entry:
+                into.setdefault(entry[0], {})[entry[1]] = entry[2]
+                count += 1
+    return count
 
-def write_xp(id: int, value: int):
-    ensure_file()
-    lines = []
-    found = False
+def load():
+    global _loaded, _journal_lines
+    with _lock:
+        ensure_file()
+        raw: dict[int, dict[int, int]] = {}
+        # xp.dat is the compacted snapshot, the journal holds absolute values written since
+        _read_entries(FILE, raw)
+        _journal_lines = _read_entries(JOURNAL, raw) if JOURNAL.exists() else 0
+        _xp.clear()
+        _dirty.clear()
+        for gid, entries in raw.items():
+            _xp[gid] = XPTable(entries)
+        _loaded = True
+        if _journal_lines >= JOURNAL_COMPACT_LINES:
+            compact()
 
-    with FILE.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or ":" not in line:
-                continue
-            parts = line.split(":")
-            if parts[0] == str(id):
-                try:
-                    current = int(parts[1])
-                except ValueError:
-                    current = 0
-                new_value = current + value
-                lines.append(f"{id}:{new_value}")
-                found = True
-            else:
-                lines.append(line)
+def _ensure_loaded():
+    if not _loaded:
+        load()
 
-    if not found:
-        lines.append(f"{id}:{value}")
+def _table(guild_id: int) -> XPTable:
+    table = _xp.get(guild_id)
+    if table is None:
+        table = _xp[guild_id] = XPTable()
+    return table
 
-    with FILE.open("w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+def _append_journal(entries):
+    global _journal_lines
+    with JOURNAL.open("a", encoding="utf-8") as f:
+        f.write("".join(f"{gid}:{uid}:{xp}\n" for (gid, uid), xp in entries))
+    _journal_lines += len(entries)
+    if _journal_lines >= JOURNAL_COMPACT_LINES:
+        compact()
 
-def convertToLevel(xp: int) -> int:
-    if xp < 0:
-        return 0
+def compact():
+    global _journal_lines
+    with _lock:
+        _ensure_loaded()
+        tmp = FILE.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for gid, table in _xp.items():
+                f.write("".join(f"{gid}:{uid}:{xp}\n" for uid, xp in table.items()))
+        os.replace(tmp, FILE)
+        # journal entries hold absolute values, so a crash between the replace
+        # and the truncate only replays entries the snapshot already contains
+        with JOURNAL.open("w", encoding="utf-8"):
+            pass
+        _journal_lines = 0
 
-    level = 0
-    remaining_xp = xp
+def claim_legacy(guild_id: int) -> bool:
+    # hands xp saved before per-guild storage to one guild, on top of anything earned there since
+    with _lock:
+        _ensure_loaded()
+        legacy = _xp.pop(LEGACY_GUILD, None)
+        if not legacy or guild_id == LEGACY_GUILD:
+            if legacy:
+                _xp[LEGACY_GUILD] = legacy
+            return False
+        table = _table(guild_id)
+        for uid, xp in legacy.items():
+            table.add(uid, xp)
+        compact()
+        return True
 
-    for inc in XP_INCREMENTS:
-        if remaining_xp >= inc:
-            remaining_xp -= inc
-            level += 1
-        else:
-            return level
+def read_xp(guild_id: int, user_id: int) -> int:
+    with _lock:
+        _ensure_loaded()
+        table = _xp.get(guild_id)
+        return table.get(user_id) if table else 0
+
+def write_xp(guild_id: int, user_id: int, value: int) -> int:
+    # runs once per message, the new value is journaled by the next flush_xp rather than here
+    with _lock:
+        _ensure_loaded()
+        new_value = _table(guild_id).add(user_id, value)
+        _dirty.add((guild_id, user_id))
+        return new_value
+
+def flush_xp() -> int:
+    with _lock:
+        if not _dirty:
+            return 0
+        entries = [((gid, uid), _table(gid).get(uid)) for gid, uid in _dirty]
+        # a failed write keeps the entries dirty for the next flush
+        _append_journal(entries)
+        _dirty.clear()
+        return len(entries)
+
+def pending_xp() -> int:
+    return len(_dirty)
+
+def set_xp_many(entries: dict[tuple[int, int], int]):
+    if not entries:
+        return
+    with _lock:
+        _ensure_loaded()
+        for (gid, uid), xp in entries.items():
+            _table(gid).set(uid, xp)
+            _dirty.discard((gid, uid))
+        _append_journal(list(entries.items()))
+
+def adopt_xp(guild_id: int, entries: dict[int, int]) -> bool:
+    # pins only fill a guild the local store knows nothing about, they never overwrite it
+    with _lock:
+        _ensure_loaded()
+        if not entries or _xp.get(guild_id):
+            return False
+        set_xp_many({(guild_id, uid): xp for uid, xp in entries.items()})
+        return True
+
+def guild_xp(guild_id: int) -> XPTable:
+    with _lock:
+        _ensure_loaded()
+        table = _xp.get(guild_id)
+        return table.copy() if table else XPTable()
+
+def is_empty() -> bool:
+    with _lock:
+        _ensure_loaded()
+        return not any(len(table) for table in _xp.values())
 
-    while level < MAX_LEVEL:
-        next_inc = XP_INCREMENTS[-1] + XP_EXTRA_STEP * (level - len(XP_INCREMENTS) + 1)
-        if remaining_xp >= next_inc:
-            remaining_xp -= next_inc
-            level += 1
+def all_xp() -> dict[int, XPTable]:
+    with _lock:
+        _ensure_loaded()
+        return {gid: table.copy() for gid, table in _xp.items()}
+
+def _build_level_table() -> list[int]:
+    table = [0]
+    total = 0
+    for level in range(MAX_LEVEL):
+        if level < len(XP_INCREMENTS):
+            inc = XP_INCREMENTS[level]
         else:
-            break
+            inc = XP_INCREMENTS[-1] + XP_EXTRA_STEP * (level - len(XP_INCREMENTS) + 1)
+        total += inc
+        table.append(total)
+    return table
+
+# LEVEL_XP[n] is the total xp needed to reach level n
+LEVEL_XP = _build_level_table()
+
+def convertToLevel(xp: int) -> int:
+    if xp < 0:
+        return 0
+    return bisect_right(LEVEL_XP, xp) - 1
 
-    return min(level, MAX_LEVEL)
+def xp_for_level(level: int) -> int:
+    return LEVEL_XP[max(0, min(level, MAX_LEVEL))]
 
-def read_level_roles():
+def progress(xp: int) -> tuple[int, int, int]:
+    level = convertToLevel(xp)
+    if level >= MAX_LEVEL:
+        return level, 0, 0
+    return level, max(xp, 0) - LEVEL_XP[level], LEVEL_XP[level + 1] - LEVEL_XP[level]
+
+def _parse_level_roles() -> list[tuple[int, int]]:
     if not ROLE_CONF.exists():
         return []
 
@@ -112,23 +304,52 @@ def read_level_roles():
 
     return sorted(roles, key=lambda x: x[0])
 
-async def check_level_reward(member, new_level: int):
-    roles = read_level_roles()
-    if not roles:
-        return None
-
-    reward_role_id = None
+def _refresh_level_roles():
+    global _roles, _role_levels, _role_ids, _reward_role_ids, _role_level_of, _roles_mtime, _roles_checked
+    now = time.monotonic()
+    if _roles_checked and now - _roles_checked < ROLE_RECHECK_INTERVAL:
+        return
+    _roles_checked = now
+    try:
+        mtime = ROLE_CONF.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime == _roles_mtime and _roles is not None:
+        return
+    roles = _parse_level_roles()
+    _role_levels = [lvl for lvl, _ in roles]
+    _role_ids = [role_id for _, role_id in roles]
+    _reward_role_ids = frozenset(_role_ids)
+    _role_level_of = {}
     for lvl, role_id in roles:
-        if new_level >= lvl:
-            reward_role_id = role_id
-        else:
-            break
+        _role_level_of[role_id] = max(lvl, _role_level_of.get(role_id, lvl))
+    _roles = roles
+    _roles_mtime = mtime
+
+def read_level_roles() -> list[tuple[int, int]]:
+    _refresh_level_roles()
+    return list(_roles)
+
+def reward_role_for_level(level: int) -> int | None:
+    _refresh_level_roles()
+    i = bisect_right(_role_levels, level) - 1
+    return _role_ids[i] if i >= 0 else None
+
+def reward_role_ids() -> frozenset[int]:
+    _refresh_level_roles()
+    return _reward_role_ids
+
+def reward_role_levels() -> dict[int, int]:
+    _refresh_level_roles()
+    return _role_level_of
 
+async def check_level_reward(member, new_level: int):
+    reward_role_id = reward_role_for_level(new_level)
     if not reward_role_id:
         return None
 
-    reward_role_ids = [role_id for _, role_id in roles]
-    to_remove = [r for r in member.roles if r.id in reward_role_ids and r.id != reward_role_id]
+    reward_ids = reward_role_ids()
+    to_remove = [r for r in member.roles if r.id in reward_ids and r.id != reward_role_id]
 
     try:
         if to_remove:
@@ -145,4 +366,64 @@ async def check_level_reward(member, new_level: int):
             print(f"[Leveling] Failed to give role {reward_role_id} to {member}: {e}")
             return None
 
-    return None
\ No newline at end of file
+    return None
+
+def plan_level_roles(members, table: XPTable) -> list[tuple[object, object]]:
+    reward_ids = reward_role_ids()
+    plan = []
+    for member in members:
+        if member.bot:
+            continue
+        target_id = reward_role_for_level(convertToLevel(table.get(member.id)))
+        if not target_id:
+            continue
+        held = {r.id for r in member.roles if r.id in reward_ids}
+        if held == {target_id}:
+            continue
+        role = member.guild.get_role(target_id)
+        if role:
+            plan.append((member, role))
+    return plan
+
+async def sync_level_roles(guild, table: XPTable, on_progress=None, concurrency: int = SYNC_CONCURRENCY) -> dict:
+    members = list(guild.members)
+    plan = plan_level_roles(members, table)
+    reward_ids = reward_role_ids()
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+    result = {"checked": len(members), "planned": len(plan), "updated": 0, "failed": 0}
+
+    async def _worker():
+        while True:
+            try:
+                member, role = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            roles = [r for r in member.roles if not r.is_default() and r.id not in reward_ids]
+            roles.append(role)
+            for attempt in range(3):
+                try:
+                    # one PATCH per member, discord.py queues it behind the route's rate-limit bucket
+                    await member.edit(roles=roles, reason=f"Level sync (level role {role.name})")
+                    result["updated"] += 1
+                    break
+                except discord.HTTPException as e:
+                    if e.status == 429 and attempt < 2:
+                        await asyncio.sleep(getattr(e, "retry_after", None) or 1.0)
+                        continue
+                    print(f"[SyncLevels] Failed for {member}: {e}")
+                    result["failed"] += 1
+                    break
+                except Exception as e:
+                    print(f"[SyncLevels] Failed for {member}: {e}")
+                    result["failed"] += 1
+                    break
+            if on_progress:
+                try:
+                    await on_progress(result["updated"] + result["failed"], len(plan), result["failed"])
+                except Exception:
+                    pass
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, concurrency))))
+    return result
@@ -0,0 +1,504 @@
+# PerfectionBot/scripts/loadsim.py
+#
+# In-process load simulator: fake guilds/members/channels with simulated REST latency and
+# rate limits, driving the real handlers from main.py. Nothing talks to discord.
+#   python -m PerfectionBot.scripts.loadsim --rate 2000 --duration 10 --guilds 3
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import discord
+
+from PerfectionBot.config import yamlHandler
+
+_ids = itertools.count(1_100_000_000_000_000_000)
+
+
+def _snowflake() -> int:
+    return next(_ids)
+
+
+class _Response:
+    # just enough of aiohttp's response for discord.HTTPException
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeRest:
+    # per route limits as (requests, per seconds), roughly what discord enforces per resource
+    LIMITS = {
+        "send_message": (5, 5.0),
+        "edit_message": (5, 5.0),
+        "delete_message": (5, 1.0),
+        "add_reaction": (1, 0.25),
+        "pin": (5, 5.0),
+        "unpin": (5, 5.0),
+        "pins": (5, 5.0),
+        "dm_send": (5, 5.0),
+        "timeout": (5, 5.0),
+        "role_edit": (10, 10.0),
+        "create_channel": (5, 10.0),
+        "fetch_user": (50, 1.0),
+    }
+
+    def __init__(self, latency: tuple[float, float], raise_429: bool, global_limit: int, seed: int):
+        self.latency = latency
+        self.raise_429 = raise_429
+        self.global_limit = global_limit
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.ratelimited: Counter = Counter()
+        self.inflight = 0
+        self.max_inflight = 0
+        self._buckets: dict[tuple[str, int], list[float]] = {}
+        self._global: list[float] = []
+
+    def _retry_after(self, route: str, key: int) -> float:
+        now = time.monotonic()
+        limit, per = self.LIMITS.get(route, (50, 1.0))
+        window = self._buckets.setdefault((route, key), [])
+        while window and window[0] <= now - per:
+            window.pop(0)
+        while self._global and self._global[0] <= now - 1.0:
+            self._global.pop(0)
+        if len(self._global) >= self.global_limit:
+            return self._global[0] + 1.0 - now
+        if len(window) >= limit:
+            return window[0] + per - now
+        window.append(now)
+        self._global.append(now)
+        return 0.0
+
+    async def call(self, route: str, key: int):
+        while True:
+            retry_after = self._retry_after(route, key)
+            if retry_after <= 0:
+                break
+            self.ratelimited[route] += 1
+            if self.raise_429:
+                e = discord.HTTPException(_Response(429, "Too Many Requests"), "You are being rate limited.")
+                e.retry_after = retry_after
+                raise e
+            # discord.py sleeps out a 429 and retries, the handler only sees the delay
+            await asyncio.sleep(retry_after)
+        self.calls[route] += 1
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self.rng.uniform(*self.latency))
+        finally:
+            self.inflight -= 1
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, administrator: bool = False):
+        self.id = role_id
+        self.name = name
+        self.color = discord.Color.default()
+        self.permissions = discord.Permissions(administrator=administrator)
+        self.mention = f"<@&{role_id}>"
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeMessage:
+    def __init__(self, sim: "Simulation", channel, author, content: str, guild=None):
+        self._sim = sim
+        self.id = _snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.guild = guild
+        self.attachments = []
+        self.deleted = False
+        self.pinned = False
+
+    async def delete(self):
+        await self._sim.rest.call("delete_message", self.channel.id)
+        self.deleted = True
+
+    async def add_reaction(self, emoji):
+        await self._sim.rest.call("add_reaction", self.channel.id)
+
+    async def edit(self, content=None, attachments=None, **kwargs):
+        await self._sim.rest.call("edit_message", self.channel.id)
+        if content is not None:
+            self.content = content
+        return self
+
+    async def pin(self):
+        await self._sim.rest.call("pin", self.channel.id)
+        self.pinned = True
+        self.channel._pins.insert(0, self)
+
+    async def unpin(self):
+        await self._sim.rest.call("unpin", self.channel.id)
+        self.pinned = False
+        if self in self.channel._pins:
+            self.channel._pins.remove(self)
+
+
+class FakeTextChannel(discord.TextChannel):
+    # a real TextChannel subclass so isinstance checks in the bot pass, none of its state is used
+    def __init__(self, sim: "Simulation", guild: "FakeGuild", name: str, channel_id: int | None = None):
+        self._sim = sim
+        self.guild = guild
+        self.id = channel_id or _snowflake()
+        self.name = name
+        self._pins: list[FakeMessage] = []
+        self.sent: list[FakeMessage] = []
+
+    def __repr__(self):
+        return f"<FakeTextChannel name={self.name!r} id={self.id}>"
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, **kwargs):
+        await self._sim.rest.call("send_message", self.id)
+        msg = FakeMessage(self._sim, self, self._sim.bot_user, content or "", self.guild)
+        msg.embeds = embeds or ([embed] if embed else [])
+        self.sent.append(msg)
+        if len(self.sent) > 200:
+            del self.sent[:100]
+        return msg
+
+    async def pins(self):
+        await self._sim.rest.call("pins", self.id)
+        return list(self._pins)
+
+
+class _DMChannel:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeMember:
+    def __init__(self, sim: "Simulation", guild: "FakeGuild", user_id: int, bot: bool = False, ban_members: bool = False):
+        self._sim = sim
+        self.guild = guild
+        self.id = user_id
+        self.bot = bot
+        self.name = f"user{user_id % 100000}"
+        self.mention = f"<@{user_id}>"
+        self.roles: list[FakeRole] = [guild.default_role]
+        self.top_role = guild.default_role
+        self.guild_permissions = discord.Permissions(ban_members=ban_members)
+        self.dm = _DMChannel(user_id)
+        self.dms: list[FakeMessage] = []
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        await self._sim.rest.call("dm_send", self.id)
+        msg = FakeMessage(self._sim, self.dm, self._sim.bot_user, content or "")
+        self.dms.append(msg)
+        self._sim.dm_index[msg.id] = self
+        return msg
+
+    async def timeout(self, until, reason=None):
+        await self._sim.rest.call("timeout", self.guild.id)
+
+    async def add_roles(self, *roles, reason=None):
+        await self._sim.rest.call("role_edit", self.guild.id)
+        self.roles.extend(r for r in roles if r and r not in self.roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await self._sim.rest.call("role_edit", self.guild.id)
+        self.roles = [r for r in self.roles if r not in roles]
+
+
+class FakeGuild:
+    def __init__(self, sim: "Simulation", users: int, log_id: int, review_id: int):
+        self._sim = sim
+        self.id = _snowflake()
+        self.name = f"sim-guild-{self.id % 10000}"
+        self.icon = None
+        self.default_role = FakeRole(self.id, "@everyone")
+        self._roles: dict[int, FakeRole] = {}
+        self._channels: dict[int, FakeTextChannel] = {}
+        self.text_channels: list[FakeTextChannel] = []
+        self.general = self._add_channel("general")
+        self.log = self._add_channel("logs", log_id)
+        self.review = self._add_channel("appeals-review", review_id)
+        self.me = FakeMember(sim, self, sim.bot_user.id, bot=True)
+        self.moderator = FakeMember(sim, self, _snowflake(), ban_members=True)
+        self._members = {m.id: m for m in (FakeMember(sim, self, _snowflake()) for _ in range(users))}
+        self._members[self.moderator.id] = self.moderator
+
+    def _add_channel(self, name: str, channel_id: int | None = None) -> FakeTextChannel:
+        ch = FakeTextChannel(self._sim, self, name, channel_id)
+        self._channels[ch.id] = ch
+        self.text_channels.append(ch)
+        return ch
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id):
+        if role_id is None:
+            return None
+        role = self._roles.get(role_id)
+        if role is None:
+            role = self._roles[role_id] = FakeRole(role_id, f"role-{role_id}")
+        return role
+
+    async def create_text_channel(self, name: str, overwrites=None, **kwargs):
+        await self._sim.rest.call("create_channel", self.id)
+        return self._add_channel(name)
+
+
+class FakePayload:
+    def __init__(self, message_id: int, user_id: int, emoji: str, guild_id: int | None = None):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.emoji = emoji
+        self.guild_id = guild_id
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.rest = FakeRest((args.latency_min / 1000, args.latency_max / 1000), args.raise_429, args.global_limit, args.seed)
+        self.bot_user = type("BotUser", (), {"id": _snowflake(), "name": "PerfectionBot", "bot": True})()
+        self.dm_index: dict[int, FakeMember] = {}
+        self.guilds: list[FakeGuild] = []
+        self.samples: list[dict] = []
+        self.workdir = Path(tempfile.mkdtemp(prefix="pb-loadsim-"))
+        self._redirected: list[tuple[object, str, object]] = []
+
+    def _redirect(self, module, attr: str, name: str):
+        self._redirected.append((module, attr, getattr(module, attr)))
+        setattr(module, attr, self.workdir / name)
+
+    def _isolate(self, main):
+        # all file writes go to a temp dir, the bot's real data/ is never touched
+        from PerfectionBot.scripts import appeals, leveling, log
+        self._redirect(main, "FLAGS_FILE", "flags.dat")
+        self._redirect(appeals, "APPEALS_PATH", "appeals.json")
+        self._redirect(appeals, "JOURNAL_PATH", "appeals.journal")
+        self._redirect(appeals, "ARCHIVE_PATH", "appeals-archive.jsonl.gz")
+        self._redirect(appeals, "ARCHIVE_INDEX_PATH", "appeals-archive.idx")
+        appeals.load_appeals()
+        self._redirect(leveling, "FILE", "xp.dat")
+        self._redirect(leveling, "JOURNAL", "xp.journal")
+        leveling.load()
+
+        log_id, review_id = _snowflake(), _snowflake()
+        log.LOG_ID = log_id
+        yamlHandler._config.setdefault("behaviour", {}).setdefault("flags", {})["review_channel"] = review_id
+        return log_id, review_id
+
+    def _wire_bot(self, main):
+        by_id = {g.id: g for g in self.guilds}
+        members = {m.id: m for g in self.guilds for m in g.members}
+
+        async def fetch_user(user_id):
+            await self.rest.call("fetch_user", 0)
+            return members[user_id]
+
+        main.bot.get_guild = by_id.get
+        main.bot.get_channel = lambda cid: None
+        main.bot.get_user = members.get
+        main.bot.fetch_user = fetch_user
+        main.bot._connection.user = self.bot_user
+
+    def _sample(self, main, started: float, sent: int, done: int):
+        from PerfectionBot.scripts import leveling, log
+        self.samples.append({
+            "t": round(time.perf_counter() - started, 2),
+            "sent": sent,
+            "done": done,
+            "filter_pending": main.filter_engine.pending,
+            "log_queue": sum(len(q.events) for q in log._queues.values()),
+            "flag_save_queue": len(main._save_queue),
+            "xp_dirty": leveling.pending_xp(),
+            "rest_inflight": self.rest.inflight
+        })
+
+    def _message(self, vocab: list[str], bad: list[str]) -> FakeMessage:
+        guild = self.rng.choice(self.guilds)
+        author = self.rng.choice(guild.members)
+        while author is guild.moderator:
+            author = self.rng.choice(guild.members)
+        words = self.rng.choices(vocab, k=self.rng.randint(3, 20))
+        if bad and self.rng.random() < self.args.bad_ratio:
+            words[self.rng.randrange(len(words))] = self.rng.choice(bad)
+        return FakeMessage(self, guild.general, author, " ".join(words), guild)
+
+    async def _drive(self, main, vocab, bad) -> dict:
+        total = int(self.args.rate * self.args.duration)
+        tick = 0.01
+        per_tick = max(1, int(self.args.rate * tick))
+        tasks = set()
+        done = 0
+        sent = 0
+
+        def _finished(t):
+            nonlocal done
+            done += 1
+            tasks.discard(t)
+
+        started = time.perf_counter()
+        next_sample = next_flush = started
+        while sent < total:
+            for _ in range(min(per_tick, total - sent)):
+                t = asyncio.create_task(main.handle_message_event(self._message(vocab, bad)))
+                t.add_done_callback(_finished)
+                tasks.add(t)
+                sent += 1
+            now = time.perf_counter()
+            if now >= next_sample:
+                self._sample(main, started, sent, done)
+                next_sample = now + self.args.sample_interval
+            if now >= next_flush:
+                asyncio.create_task(main.flush_flag_saves())
+                next_flush = now + self.args.flush_interval
+            # pace to the target rate; if the handlers can't keep up the loop just falls behind
+            target = started + sent / self.args.rate
+            await asyncio.sleep(max(0.0, target - time.perf_counter()))
+
+        generated = time.perf_counter() - started
+        if tasks:
+            await asyncio.gather(*list(tasks), return_exceptions=True)
+        self._sample(main, started, sent, done)
+        elapsed = time.perf_counter() - started
+        await main.flush_flag_saves()
+        return {"messages": sent, "generate_s": round(generated, 3), "elapsed_s": round(elapsed, 3),
+                "throughput_msg_s": round(sent / elapsed, 1) if elapsed else None}
+
+    async def _appeal_flow(self, main) -> dict:
+        from PerfectionBot.scripts import appeals
+        warned = list(appeals.keys_with_status("warned"))
+        self.rng.shuffle(warned)
+        picked = warned[:int(len(warned) * self.args.appeal_ratio)]
+        started = time.perf_counter()
+        for key in picked:
+            member = self.dm_index.get(int(key))
+            if member:
+                await main.on_raw_reaction_add(FakePayload(int(key), member.id, "⚠️"))
+        submitted = appeals.keys_with_status("appealed")
+        accepted = rejected = 0
+        for key in submitted:
+            ap = appeals.get_appeal(key)
+            guild = next((g for g in self.guilds if g.id == ap["guild_id"]), None)
+            if not guild or not ap.get("review_msg_id"):
+                continue
+            emoji = "✅" if self.rng.random() < 0.5 else "❌"
+            await main.on_raw_reaction_add(FakePayload(ap["review_msg_id"], guild.moderator.id, emoji, guild.id))
+            accepted += emoji == "✅"
+            rejected += emoji == "❌"
+        await appeals.save_appeals()
+        return {"warned": len(warned), "appealed": len(picked), "reviewed": len(submitted),
+                "accepted": accepted, "rejected": rejected, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+    async def run(self) -> dict:
+        from PerfectionBot import main
+        from PerfectionBot.scripts import filter, log, metrics
+
+        log_id, review_id = self._isolate(main)
+        self.guilds = [FakeGuild(self, self.args.users, log_id, review_id) for _ in range(self.args.guilds)]
+        self._wire_bot(main)
+
+        vocab = ["hello", "there", "what", "is", "going", "on", "today", "nice", "game", "lol",
+                 "anyone", "want", "to", "play", "later", "the", "server", "is", "great", "thanks"]
+        bad = list(filter.blacklist[:50]) or ["badword"]
+        if not filter.blacklist:
+            filter.set_blacklist(bad)
+
+        load = await self._drive(main, vocab, bad)
+        appeal = await self._appeal_flow(main)
+        await log.flush_logs()
+        await asyncio.sleep(0)
+
+        hist = {h.name: h.summary() for h in metrics.registry.collect(metrics.Histogram)}
+        result = {
+            "args": vars(self.args),
+            "load": load,
+            "appeals": appeal,
+            "rest_calls": dict(self.rest.calls),
+            "rest_calls_total": sum(self.rest.calls.values()),
+            "ratelimited": dict(self.rest.ratelimited),
+            "rest_max_inflight": self.rest.max_inflight,
+            "max_queue_depth": {k: max(s[k] for s in self.samples) for k in
+                                ("filter_pending", "log_queue", "flag_save_queue", "xp_dirty", "rest_inflight")},
+            "latency": hist,
+            "samples": self.samples
+        }
+        return result
+
+    def cleanup(self):
+        for module, attr, value in reversed(self._redirected):
+            setattr(module, attr, value)
+        self._redirected.clear()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _report(result: dict):
+    load = result["load"]
+    print(f"messages: {load['messages']} in {load['elapsed_s']}s -> {load['throughput_msg_s']} msg/s")
+    print(f"appeals: {result['appeals']}")
+    print(f"REST calls: {result['rest_calls_total']} {result['rest_calls']}")
+    print(f"429s: {sum(result['ratelimited'].values())} {result['ratelimited']}")
+    print(f"max queue depth: {result['max_queue_depth']}")
+    h = result["latency"].get("handle_message_event")
+    if h:
+        print(f"handle_message_event p50 {h['p50']*1000:.2f}ms p99 {h['p99']*1000:.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive main.py's handlers against a fake discord.")
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second to generate")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of load")
+    parser.add_argument("--guilds", type=int, default=2)
+    parser.add_argument("--users", type=int, default=500, help="members per guild")
+    parser.add_argument("--bad-ratio", type=float, default=0.02, help="share of messages with a blacklisted word")
+    parser.add_argument("--appeal-ratio", type=float, default=0.3, help="share of warned users who appeal")
+    parser.add_argument("--latency-min", type=float, default=30, help="min simulated REST latency, ms")
+    parser.add_argument("--latency-max", type=float, default=120, help="max simulated REST latency, ms")
+    parser.add_argument("--global-limit", type=int, default=50, help="global REST requests per second before 429s")
+    parser.add_argument("--raise-429", action="store_true", help="surface 429s to the handlers instead of sleeping them out like discord.py")
+    parser.add_argument("--flush-interval", type=float, default=5, help="how often flush_flag_saves runs, s")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="queue depth sampling interval, s")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", type=Path, help="write the full result as json here")
+    args = parser.parse_args(argv)
+
+    sim = Simulation(args)
+    try:
+        result = asyncio.run(sim.run())
+    finally:
+        sim.cleanup()
+    _report(result)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        with args.out.open("w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
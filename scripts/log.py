@@ -1,5 +1,8 @@
 #log
 
+import asyncio
+from collections import Counter
+
 import discord
 from PerfectionBot.config.yamlHandler import get_value
 
@@ -14,6 +17,122 @@ ICON_URLS = {
     "fail": get_value("ICONS", "icon_fail")
 }
 
+LOG_ID = get_value("LOG_ID")
+FLUSH_WINDOW = float(get_value("behaviour", "log", "FLUSH_WINDOW_MS", default=1000)) / 1000
+MAX_BUFFER = int(get_value("behaviour", "log", "MAX_BUFFER", default=200))
+HARD_CAP = max(MAX_BUFFER, int(get_value("behaviour", "log", "HARD_CAP", default=1000)))
+MAX_MESSAGES = max(1, int(get_value("behaviour", "log", "MAX_MESSAGES", default=2)))
+MAX_EMBEDS = 10
+MAX_CHARS = 6000
+MAX_DESCRIPTION = 4096
+LOW_PRIORITY = frozenset({"warn", "info", "verify"})
+
+class _GuildLog:
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.events: list[tuple[str, discord.Color, str, object]] = []
+        self.shed: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.task: asyncio.Task | None = None
+
+    def push(self, message: str, color: discord.Color, event_type: str):
+        if len(self.events) >= MAX_BUFFER:
+            # low priority events are shed first, a ban or kick is only dropped once the hard cap is hit
+            drop = next((i for i, ev in enumerate(self.events) if ev[2] in LOW_PRIORITY), None)
+            if drop is not None:
+                self.shed[self.events.pop(drop)[2]] += 1
+            elif len(self.events) >= HARD_CAP:
+                # nothing left to shed, past the hard cap even the oldest ban only survives as a count
+                self.dropped[self.events.pop(0)[2]] += 1
+        self.events.append((message, color, event_type, discord.utils.utcnow()))
+
+_queues: dict[int, _GuildLog] = {}
+
+def _build_embed(guild: discord.Guild, message: str, color: discord.Color, event_type: str, when) -> discord.Embed:
+    icon = ICON_URLS.get(event_type, ICON_URLS["info"])
+    if len(message) > MAX_DESCRIPTION:
+        message = message[:MAX_DESCRIPTION - 1] + "…"
+    embed = discord.Embed(
+        description=message,
+        color=color,
+        timestamp=when
+    )
+    embed.set_author(name=guild.name, icon_url=guild.icon.url if guild.icon else None)
+    embed.set_thumbnail(url=icon)
+    return embed
+
+def _summary_embed(counts: Counter) -> discord.Embed:
+    parts = [f"+{n} more {kind}{'s' if n != 1 else ''}" for kind, n in counts.most_common()]
+    return discord.Embed(
+        description="📦 " + ", ".join(parts),
+        color=discord.Color.dark_grey(),
+        timestamp=discord.utils.utcnow()
+    )
+
+def _dropped_embed(counts: Counter) -> discord.Embed:
+    total = sum(counts.values())
+    parts = [f"{n} {kind}{'s' if n != 1 else ''}" for kind, n in counts.most_common()]
+    return discord.Embed(
+        description=f"⚠️ {total} event{'s' if total != 1 else ''} dropped, the log queue was full ({', '.join(parts)})",
+        color=discord.Color.dark_red(),
+        timestamp=discord.utils.utcnow()
+    )
+
+def _pack(q: _GuildLog) -> list[list[discord.Embed]]:
+    events, q.events = q.events, []
+    overflow, q.shed = q.shed, Counter()
+    dropped, q.dropped = q.dropped, Counter()
+
+    # split the window into messages under discord's embed and character caps; high priority events
+    # always go out, low priority ones stop after MAX_MESSAGES and get folded into a summary line
+    messages: list[list[discord.Embed]] = [[]]
+    size = 0
+    folding = False
+
+    def place(embed: discord.Embed):
+        nonlocal size
+        n = len(embed)
+        if len(messages[-1]) >= MAX_EMBEDS or size + n > MAX_CHARS:
+            messages.append([])
+            size = 0
+        messages[-1].append(embed)
+        size += n
+
+    for ev in events:
+        embed = _build_embed(q.guild, *ev)
+        if ev[2] in LOW_PRIORITY:
+            if not folding:
+                full = len(messages[-1]) >= MAX_EMBEDS or size + len(embed) > MAX_CHARS
+                folding = full and len(messages) >= MAX_MESSAGES
+            if folding:
+                overflow[ev[2]] += 1
+                continue
+        place(embed)
+    if overflow:
+        place(_summary_embed(overflow))
+    if dropped:
+        place(_dropped_embed(dropped))
+    return [m for m in messages if m]
+
+async def _flusher(q: _GuildLog):
+    try:
+        while q.events or q.shed or q.dropped:
+            await asyncio.sleep(FLUSH_WINDOW)
+            channel = q.guild.get_channel(LOG_ID)
+            if not channel or not isinstance(channel, discord.TextChannel):
+                q.events.clear()
+                q.shed.clear()
+                q.dropped.clear()
+                return
+            for embeds in _pack(q):
+                try:
+                    await channel.send(embeds=embeds)
+                except Exception as e:
+                    print(f"[log.py] Logging failed: {e}")
+    finally:
+        if q.task is asyncio.current_task():
+            q.task = None
+
 async def log_to_channel(
     guild: discord.Guild,
     message: str,
@@ -21,22 +140,30 @@ async def log_to_channel(
     event_type: str = "info"
 ):
     try:
-        log_channel_id = get_value("LOG_ID")
-        channel = guild.get_channel(log_channel_id)
-        if not channel or not isinstance(channel, discord.TextChannel):
+        if guild is None:
             return
-
-        icon = ICON_URLS.get(event_type.lower(), ICON_URLS["info"])
-
-        embed = discord.Embed(
-            description=message,
-            color=color,
-            timestamp=discord.utils.utcnow()
-        )
-        embed.set_author(name=guild.name, icon_url=guild.icon.url if guild.icon else None)
-        embed.set_thumbnail(url=icon)
-
-        await channel.send(embed=embed)
-
+        q = _queues.get(guild.id)
+        if q is None:
+            q = _queues[guild.id] = _GuildLog(guild)
+        q.guild = guild
+        q.push(message, color, event_type.lower())
+        if q.task is None:
+            q.task = asyncio.create_task(_flusher(q))
     except Exception as e:
-        print(f"[log.py] Logging failed: {e}")
\ No newline at end of file
+        print(f"[log.py] Logging failed: {e}")
+
+async def flush_logs():
+    for q in list(_queues.values()):
+        channel = q.guild.get_channel(LOG_ID)
+        if not channel or not isinstance(channel, discord.TextChannel):
+            continue
+        if q.task is not None:
+            q.task.cancel()
+            q.task = None
+        while q.events or q.shed or q.dropped:
+            try:
+                for embeds in _pack(q):
+                    await channel.send(embeds=embeds)
+            except Exception as e:
+                print(f"[log.py] Logging failed: {e}")
+                break
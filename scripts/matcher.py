@@ -0,0 +1,118 @@
+# PerfectionBot/scripts/matcher.py
+
+from collections import deque
+from rapidfuzz import distance
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[str]] = [[]]
+        for p in patterns:
+            if p:
+                self._add(p)
+        self._build()
+
+    def _add(self, pattern: str):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if pattern not in self._out[node]:
+            self._out[node].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def iter(self, text: str):
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern in out[node]:
+                yield i - len(pattern) + 1, i + 1, pattern
+
+
+class BKTree:
+    def __init__(self, words=()):
+        self._root = None
+        for w in words:
+            self.add(w)
+
+    def add(self, word: str):
+        if self._root is None:
+            self._root = (word, {})
+            return
+        node = self._root
+        while True:
+            d = distance.Levenshtein.distance(word, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, radius: int) -> list[tuple[int, str]]:
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            cand, children = stack.pop()
+            d = distance.Levenshtein.distance(word, cand)
+            if d <= radius:
+                found.append((d, cand))
+            lo, hi = d - radius, d + radius
+            for k, child in children.items():
+                if lo <= k <= hi:
+                    stack.append(child)
+        return found
+
+
+class BlacklistIndex:
+    def __init__(self, words: list[str], version: int = 0):
+        self.words = [w for w in dict.fromkeys(words) if w]
+        self.version = version
+        self.exact = set(self.words)
+        self.max_len = max((len(w) for w in self.words), default=0)
+        self.order = {w: i for i, w in enumerate(self.words)}
+        self.automaton = AhoCorasick(self.words)
+        self.bktree = BKTree(self.words)
+
+    def phrase_hits(self, tokens: list[str]) -> list[str]:
+        # exact hits that line up with whole tokens, including multi-word entries
+        text = " ".join(tokens)
+        hits = []
+        for start, end, pattern in self.automaton.iter(text):
+            if start > 0 and text[start - 1] != " ":
+                continue
+            if end < len(text) and text[end] != " ":
+                continue
+            hits.append(pattern)
+        return hits
+
+    def fuzzy(self, word: str, max_edits: int) -> list[str]:
+        found = self.bktree.search(word, max_edits)
+        found.sort(key=lambda x: (x[0], self.order[x[1]]))
+        return [w for _, w in found]
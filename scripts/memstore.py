@@ -0,0 +1,238 @@
+# PerfectionBot/scripts/memstore.py
+
+import base64
+import io
+import re
+
+import discord
+
+from PerfectionBot.config.yamlHandler import get_value
+
+SHARD_BYTES = int(get_value("behaviour", "memstore", "SHARD_BYTES", default=1400))
+MAX_SHARDS = int(get_value("behaviour", "memstore", "MAX_SHARDS", default=16))
+INLINE_LIMIT = 1900
+
+_HEADER = re.compile(r"^\[([A-Z]+) (\d+)/(\d+)\]")
+
+# (guild_id, kind) -> {"n": shard count, "msgs": {index: Message}, "bodies": {index: bytes},
+#                      "legacy": [Message], "legacy_data": {id: value}, "stale": [Message]}
+_shards: dict[tuple[int, str], dict] = {}
+
+
+class ShardReadError(Exception):
+    # some current shards couldn't be read, data holds what could be
+    def __init__(self, message: str, data: dict[int, int]):
+        super().__init__(message)
+        self.data = data
+
+
+def _put_varint(buf: bytearray, n: int):
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            buf.append(b | 0x80)
+        else:
+            buf.append(b)
+            return
+
+
+def _get_varint(data: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+def encode_pairs(pairs: dict[int, int]) -> bytes:
+    buf = bytearray()
+    prev = 0
+    for uid in sorted(pairs):
+        value = pairs[uid]
+        _put_varint(buf, uid - prev)
+        _put_varint(buf, (value << 1) ^ (value >> 63))
+        prev = uid
+    return bytes(buf)
+
+
+def decode_pairs(data: bytes) -> dict[int, int]:
+    out = {}
+    pos = prev = 0
+    while pos < len(data):
+        delta, pos = _get_varint(data, pos)
+        zz, pos = _get_varint(data, pos)
+        prev += delta
+        out[prev] = (zz >> 1) ^ -(zz & 1)
+    return out
+
+
+def shard_of(uid: int, n: int) -> int:
+    # snowflake low bits are mostly zero, mix them before bucketing
+    return ((uid * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32 & (n - 1)
+
+
+def split_shards(pairs: dict[int, int], n: int) -> list[bytes]:
+    buckets = [{} for _ in range(n)]
+    for uid, value in pairs.items():
+        buckets[shard_of(uid, n)][uid] = value
+    return [encode_pairs(b) for b in buckets]
+
+
+def plan_shards(pairs: dict[int, int], current: int = 1) -> tuple[int, list[bytes]]:
+    # shard counts only grow and stay powers of two, so a save rarely moves users between shards
+    n = max(1, current)
+    shards = split_shards(pairs, n)
+    while n < MAX_SHARDS and any(len(s) > SHARD_BYTES for s in shards):
+        n *= 2
+        shards = split_shards(pairs, n)
+    return n, shards
+
+
+def parse_legacy(content: str, guild_id: int) -> dict[int, int]:
+    out = {}
+    body = content.split("\n", 1)[1] if "\n" in content else ""
+    for ln in body.splitlines():
+        parts = ln.strip().split(":")
+        # guild:id:value lines may belong to another guild, id:value lines are this channel's own
+        if len(parts) >= 3 and parts[0] != str(guild_id):
+            continue
+        try:
+            out[int(parts[-2])] = int(parts[-1])
+        except (ValueError, IndexError):
+            continue
+    return out
+
+
+def _render(kind: str, index: int, n: int, payload: bytes) -> tuple[str, discord.File | None]:
+    header = f"[{kind} {index + 1}/{n}]\n"
+    encoded = base64.b64encode(payload).decode("ascii")
+    if len(header) + len(encoded) <= INLINE_LIMIT:
+        return header + encoded, None
+    return header, discord.File(io.BytesIO(payload), filename=f"{kind.lower()}-{index + 1}.bin")
+
+
+async def _read_shard(msg: discord.Message) -> bytes:
+    if msg.attachments:
+        return await msg.attachments[0].read()
+    body = msg.content.split("\n", 1)[1] if "\n" in msg.content else ""
+    return base64.b64decode(body.strip()) if body.strip() else b""
+
+
+def _new_state() -> dict:
+    return {"n": 1, "msgs": {}, "bodies": {}, "legacy": [], "legacy_data": {}, "stale": []}
+
+
+def _scan_pins(pinned, kind: str, guild_id: int, state: dict) -> list[tuple[int, int, discord.Message]]:
+    legacy_prefix = f"[{kind}]\n"
+    found = []
+    for p in pinned:
+        if p.content.startswith(legacy_prefix):
+            state["legacy"].append(p)
+            state["legacy_data"].update(parse_legacy(p.content, guild_id))
+            continue
+        m = _HEADER.match(p.content)
+        if m and m.group(1) == kind:
+            found.append((int(m.group(3)), int(m.group(2)) - 1, p))
+    state["n"] = max((f[0] for f in found), default=state["n"])
+    state["stale"] = [p for shard_n, _, p in found if shard_n != state["n"]]
+    return found
+
+
+async def load(channel: discord.TextChannel, kind: str, guild_id: int) -> dict[int, int]:
+    pinned = await channel.pins()
+    state = _shards[(guild_id, kind)] = _new_state()
+    found = _scan_pins(pinned, kind, guild_id, state)
+    n = state["n"]
+    data = {}
+    unread = 0
+    # stale shards from before a reshard are merged first so current shards win
+    for shard_n, index, p in sorted(found, key=lambda f: f[0]):
+        if shard_n == n:
+            # known even if unreadable, so the next save edits this pin instead of pinning a second copy
+            state["msgs"][index] = p
+        try:
+            payload = await _read_shard(p)
+            data.update(decode_pairs(payload))
+        except Exception as e:
+            print(f"[memstore] failed to read {kind} shard {index + 1}/{shard_n}: {e}")
+            if shard_n == n:
+                unread += 1
+            continue
+        if shard_n == n:
+            state["bodies"][index] = payload
+    if unread:
+        raise ShardReadError(f"{unread} of {n} {kind} shards unreadable", data)
+    return data
+
+
+def legacy_pairs(kind: str, guild_id: int) -> dict[int, int]:
+    # pins from before sharding, kept apart from load() since their contents may not belong to this guild
+    state = _shards.get((guild_id, kind))
+    return dict(state["legacy_data"]) if state else {}
+
+
+def in_sync(kind: str, guild_id: int) -> bool:
+    # true once every current shard made it to discord on the last save
+    state = _shards.get((guild_id, kind))
+    return state is not None and len(state["bodies"]) == state["n"]
+
+
+async def save(channel: discord.TextChannel, kind: str, guild_id: int, pairs: dict[int, int]) -> int:
+    state = _shards.get((guild_id, kind))
+    if state is None:
+        # load() never got this far, pick up the shards already pinned so they get edited rather than duplicated
+        state = _new_state()
+        try:
+            for shard_n, index, p in _scan_pins(await channel.pins(), kind, guild_id, state):
+                if shard_n == state["n"]:
+                    state["msgs"][index] = p
+            # nobody has read the old-format pins yet, leave them for the next load
+            state["legacy"].clear()
+        except Exception as e:
+            print(f"[memstore] reading {kind} pins before save failed: {e}")
+            return 0
+        _shards[(guild_id, kind)] = state
+    n, shards = plan_shards(pairs, state["n"])
+    if n != state["n"]:
+        state["bodies"].clear()
+        state["n"] = n
+
+    written = 0
+    for index, payload in enumerate(shards):
+        if state["bodies"].get(index) == payload and index in state["msgs"]:
+            continue
+        content, file = _render(kind, index, n, payload)
+        msg = state["msgs"].get(index)
+        try:
+            if msg and not getattr(msg, "deleted", False):
+                if file:
+                    msg = await msg.edit(content=content, attachments=[file])
+                else:
+                    msg = await msg.edit(content=content, attachments=[])
+            else:
+                msg = await channel.send(content, file=file) if file else await channel.send(content)
+                await msg.pin()
+        except Exception as e:
+            print(f"[memstore] writing {kind} shard {index + 1}/{n} failed: {e}")
+            state["msgs"].pop(index, None)
+            state["bodies"].pop(index, None)
+            continue
+        state["msgs"][index] = msg
+        state["bodies"][index] = payload
+        written += 1
+
+    if len(state["bodies"]) == n:
+        # every current shard is written, anything else pinned for this kind is out of date
+        extra = [state["msgs"].pop(i) for i in list(state["msgs"]) if i >= n]
+        for old in state["legacy"] + state["stale"] + extra:
+            try:
+                await old.unpin()
+            except Exception as e:
+                print(f"[memstore] failed to unpin old {kind} message: {e}")
+        state["legacy"].clear()
+        state["stale"].clear()
+    return written
@@ -0,0 +1,300 @@
+# PerfectionBot/scripts/metrics.py
+
+import asyncio
+import functools
+import json
+import threading
+import time
+from array import array
+
+from PerfectionBot.config.yamlHandler import get_value
+
+HOST = str(get_value("behaviour", "metrics", "HOST", default="127.0.0.1"))
+PORT = int(get_value("behaviour", "metrics", "PORT", default=0))
+
+# log-linear buckets: exact below 32us, then 16 buckets per power of two (about 6% error)
+_SUB = 32
+_HALF = 16
+_MAX_SHIFT = 40
+_NBUCKETS = _SUB + _MAX_SHIFT * _HALF
+
+
+def _bucket(us: int) -> int:
+    if us < _SUB:
+        return max(us, 0)
+    shift = us.bit_length() - 5
+    if shift > _MAX_SHIFT:
+        return _NBUCKETS - 1
+    return _SUB + (shift - 1) * _HALF + ((us >> shift) - _HALF)
+
+
+def _bucket_value(idx: int) -> float:
+    if idx < _SUB:
+        return float(idx)
+    shift = (idx - _SUB) // _HALF + 1
+    mant = (idx - _SUB) % _HALF + _HALF
+    return ((mant << shift) + ((mant + 1) << shift) - 1) / 2
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    __slots__ = ("name", "labels", "value", "rate", "_last", "_last_at")
+
+    def __init__(self, name: str, labels: tuple):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.rate = 0.0
+        self._last = 0
+        self._last_at = time.monotonic()
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+    def _tick(self, now: float):
+        dt = now - self._last_at
+        if dt > 0:
+            value = self.value
+            self.rate = (value - self._last) / dt
+            self._last, self._last_at = value, now
+
+
+class Gauge:
+    __slots__ = ("name", "labels", "value")
+
+    def __init__(self, name: str, labels: tuple):
+        self.name = name
+        self.labels = labels
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def dec(self, n: float = 1):
+        self.value -= n
+
+
+class Histogram:
+    __slots__ = ("name", "labels", "counts", "count", "total", "max")
+
+    def __init__(self, name: str, labels: tuple):
+        self.name = name
+        self.labels = labels
+        self.counts = array("Q", bytes(8 * _NBUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[_bucket(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= rank:
+                    return min(_bucket_value(idx) / 1_000_000, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._collectors: list = []
+
+    def _get(self, cls, name: str, labels: dict):
+        key = (cls, name, _labels_key(labels))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(name, key[2])
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(Histogram, name, labels)
+
+    def collector(self, func):
+        # func refreshes gauges for numbers that live elsewhere, run before every export and tick
+        self._collectors.append(func)
+        return func
+
+    def _run_collectors(self):
+        for func in list(self._collectors):
+            try:
+                func()
+            except Exception as e:
+                print(f"[metrics] collector {getattr(func, '__name__', func)} failed: {e}")
+
+    def collect(self, cls=None, name: str | None = None) -> list:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [m for m in metrics if (cls is None or isinstance(m, cls)) and (name is None or m.name == name)]
+
+    def tick(self):
+        # called on a fixed interval (watchdog sampler) so counter rates cover a steady window
+        self._run_collectors()
+        now = time.monotonic()
+        for c in self.collect(Counter):
+            c._tick(now)
+
+    def to_json(self) -> dict:
+        self._run_collectors()
+        out = {"counters": [], "gauges": [], "histograms": []}
+        for m in self.collect():
+            labels = dict(m.labels)
+            if isinstance(m, Counter):
+                out["counters"].append({"name": m.name, "labels": labels, "value": m.value, "rate": m.rate})
+            elif isinstance(m, Gauge):
+                out["gauges"].append({"name": m.name, "labels": labels, "value": m.value})
+            else:
+                out["histograms"].append({"name": m.name, "labels": labels, **m.summary()})
+        return out
+
+    def to_prometheus(self) -> str:
+        self._run_collectors()
+        lines = []
+        typed = set()
+
+        def _fmt(labels: tuple, extra: tuple = ()) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        for m in sorted(self.collect(), key=lambda m: (m.name, m.labels)):
+            if isinstance(m, Counter):
+                name = f"perfectionbot_{m.name}_total"
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_fmt(m.labels)} {m.value}")
+            elif isinstance(m, Gauge):
+                name = f"perfectionbot_{m.name}"
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_fmt(m.labels)} {m.value}")
+            else:
+                name = f"perfectionbot_{m.name}_seconds"
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} summary")
+                for q in (0.5, 0.9, 0.99):
+                    lines.append(f"{name}{_fmt(m.labels, (('quantile', q),))} {m.percentile(q):.6f}")
+                lines.append(f"{name}_sum{_fmt(m.labels)} {m.total:.6f}")
+                lines.append(f"{name}_count{_fmt(m.labels)} {m.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+
+
+class timer:
+    __slots__ = ("_hist", "_start")
+
+    def __init__(self, name: str, **labels):
+        self._hist = registry.histogram(name, **labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._start)
+        return False
+
+
+def timed(name: str, **labels):
+    def deco(func):
+        hist = registry.histogram(name, **labels)
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    hist.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return deco
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        parts = request.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else "/"
+        if path.startswith("/metrics.json"):
+            body, ctype, status = json.dumps(registry.to_json()).encode(), "application/json", "200 OK"
+        elif path.startswith("/metrics"):
+            body, ctype, status = registry.to_prometheus().encode(), "text/plain; version=0.0.4", "200 OK"
+        else:
+            body, ctype, status = b"not found\n", "text/plain", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+_server = None
+
+
+async def start_http(host: str = HOST, port: int = PORT):
+    global _server
+    if _server is not None or not port:
+        return
+    try:
+        _server = await asyncio.start_server(_handle_http, host, port)
+        print(f"[metrics] serving /metrics and /metrics.json on {host}:{port}")
+    except Exception as e:
+        print(f"[metrics] could not start endpoint: {e}")
@@ -1,10 +1,14 @@
 # watchdog.py
 
 import asyncio
+import math
 import os
 import platform
 import shutil
 import subprocess
+import threading
+import time
+from array import array
 from datetime import datetime, timezone
 from typing import Optional
 
@@ -14,6 +18,8 @@ from discord.ext import commands
 
 from PerfectionBot.config.yamlHandler import get_value
 from PerfectionBot.scripts.log import log_to_channel
+from PerfectionBot.scripts.lagprof import profiler, bucket_label
+from PerfectionBot.scripts import metrics
 
 try:
     import psutil
@@ -32,7 +38,7 @@ def _format_bytes(n: Optional[int]) -> str:
     return f"{n:,.1f} PB"
 
 
-async def collect_status(bot: discord.Client) -> dict:
+def _read_system() -> dict:
     ram_used = ram_total = ram_available = ram_percent = None
     cpu_percent = None
     disk_used = disk_total = disk_percent = disk_free = None
@@ -48,12 +54,10 @@ async def collect_status(bot: discord.Client) -> dict:
             ram_used = ram_total = ram_available = ram_percent = None
 
         try:
-            cpu_percent = psutil.cpu_percent(interval=0.1)
+            # usage since the previous call, the sampler calls this on a fixed interval
+            cpu_percent = psutil.cpu_percent(interval=None)
         except Exception:
-            try:
-                cpu_percent = psutil.cpu_percent(interval=None)
-            except Exception:
-                cpu_percent = None
+            cpu_percent = None
 
         try:
             du = psutil.disk_usage("/")
@@ -86,7 +90,151 @@ async def collect_status(bot: discord.Client) -> dict:
         except Exception:
             disk_total = disk_used = disk_percent = disk_free = None
 
-        cpu_percent = None
+    return {
+        "ram_used": ram_used,
+        "ram_available": ram_available,
+        "ram_total": ram_total,
+        "ram_percent": ram_percent,
+        "cpu_percent": cpu_percent,
+        "disk_used": disk_used,
+        "disk_total": disk_total,
+        "disk_free": disk_free,
+        "disk_percent": disk_percent,
+    }
+
+
+SERIES = ("cpu_percent", "ram_percent", "disk_percent", "disk_free", "ws_latency", "loop_lag")
+
+
+class Sampler:
+    def __init__(self, interval: float, history_minutes: float):
+        self.interval = max(0.5, interval)
+        self.capacity = max(2, int(history_minutes * 60 / self.interval))
+        self._ts = array("d", [0.0]) * self.capacity
+        # nan marks a metric that could not be read for that sample
+        self._series = {name: array("d", [math.nan]) * self.capacity for name in SERIES}
+        self._next = 0
+        self._count = 0
+        self._latest: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._bot = None
+        self._loop = None
+        self._lag = None
+        self._sent: Optional[float] = None
+
+    def start(self, bot: discord.Client, loop: asyncio.AbstractEventLoop):
+        self._bot = bot
+        self._loop = loop
+        self._sent = None
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watchdog-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _ping(self, sent: float):
+        self._lag = time.perf_counter() - sent
+        if self._sent == sent:
+            self._sent = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"[watchdog] sampling failed: {e}")
+            try:
+                metrics.registry.tick()
+            except Exception as e:
+                print(f"[watchdog] metrics tick failed: {e}")
+            self._stop.wait(self.interval)
+
+    def _sample(self):
+        values = _read_system()
+        try:
+            values["ws_latency"] = getattr(self._bot, "latency", None)
+        except Exception:
+            values["ws_latency"] = None
+        # how long the loop took to run a callback we queued a whole interval ago; if it still hasn't
+        # run, the loop is stuck and has been for at least as long as the ping has been waiting
+        sent = self._sent
+        if sent is not None:
+            values["loop_lag"] = time.perf_counter() - sent
+        else:
+            values["loop_lag"] = self._lag
+            if self._loop is not None and not self._loop.is_closed():
+                sent = self._sent = time.perf_counter()
+                try:
+                    self._loop.call_soon_threadsafe(self._ping, sent)
+                except RuntimeError:
+                    self._sent = None
+        values["sampled_at"] = time.time()
+
+        with self._lock:
+            i = self._next
+            self._ts[i] = values["sampled_at"]
+            for name in SERIES:
+                v = values.get(name)
+                try:
+                    self._series[name][i] = math.nan if v is None else float(v)
+                except (TypeError, ValueError):
+                    self._series[name][i] = math.nan
+            self._next = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._latest = values
+
+    def latest(self) -> Optional[dict]:
+        with self._lock:
+            return dict(self._latest) if self._latest else None
+
+    def summary(self, minutes: float) -> dict:
+        cutoff = time.time() - minutes * 60
+        with self._lock:
+            idx = [i for i in range(self.capacity) if i < self._count and self._ts[i] >= cutoff]
+            cols = {name: [self._series[name][i] for i in idx] for name in SERIES}
+        out = {"samples": len(idx)}
+        for name, vals in cols.items():
+            vals = sorted(v for v in vals if not math.isnan(v))
+            if not vals:
+                out[name] = None
+                continue
+            p95 = vals[min(len(vals) - 1, int(math.ceil(len(vals) * 0.95)) - 1)]
+            out[name] = (vals[0], sum(vals) / len(vals), p95)
+        return out
+
+
+try:
+    _sample_interval = float(get_value("watchdog", "sample_interval"))
+except Exception:
+    _sample_interval = 5.0
+try:
+    _history_minutes = float(get_value("watchdog", "history_minutes"))
+except Exception:
+    _history_minutes = 60.0
+
+sampler = Sampler(_sample_interval, _history_minutes)
+
+
+async def collect_status(bot: discord.Client) -> dict:
+    sample = sampler.latest()
+    if sample is None:
+        sample = await asyncio.to_thread(_read_system)
+
+    ram_used = sample.get("ram_used")
+    ram_total = sample.get("ram_total")
+    ram_available = sample.get("ram_available")
+    ram_percent = sample.get("ram_percent")
+    cpu_percent = sample.get("cpu_percent")
+    disk_used = sample.get("disk_used")
+    disk_total = sample.get("disk_total")
+    disk_free = sample.get("disk_free")
+    disk_percent = sample.get("disk_percent")
+    loop_lag = sample.get("loop_lag")
 
     ws_latency = None
     try:
@@ -94,6 +242,16 @@ async def collect_status(bot: discord.Client) -> dict:
     except Exception:
         ws_latency = None
 
+    filter_latency = {}
+    for name in ("filter_check", "check_bad", "handle_message_event"):
+        hist = metrics.registry.collect(metrics.Histogram, name)
+        if hist and hist[0].count:
+            filter_latency[name] = (hist[0].percentile(0.5), hist[0].percentile(0.99))
+    message_rates = {dict(c.labels).get("guild"): c.rate for c in metrics.registry.collect(metrics.Counter, "messages")}
+    # refreshed from the filter (or its workers) on every sampler tick
+    filter_cache = {g.name[len("filter_"):]: g.value for g in metrics.registry.collect(metrics.Gauge)
+                    if g.name.startswith(("filter_verdict_", "filter_word_"))}
+
     os_info = platform.platform()
     python_version = platform.python_version()
 
@@ -150,6 +308,10 @@ async def collect_status(bot: discord.Client) -> dict:
         "disk_free": disk_free,
         "disk_percent": disk_percent,
         "ws_latency": ws_latency,
+        "loop_lag": loop_lag,
+        "latency": filter_latency,
+        "message_rates": message_rates,
+        "filter_cache": filter_cache,
         "os": os_info,
         "python_version": python_version,
         "version": version,
@@ -160,6 +322,31 @@ async def collect_status(bot: discord.Client) -> dict:
     }
 
 
+def _format_window(name: str, stats) -> str:
+    if not stats:
+        return "no samples"
+    lo, avg, p95 = stats
+    if name in ("ws_latency", "loop_lag"):
+        return f"min {lo*1000:.0f} / avg {avg*1000:.0f} / p95 {p95*1000:.0f} ms"
+    return f"min {lo:.1f}% / avg {avg:.1f}% / p95 {p95:.1f}%"
+
+
+def _add_history_fields(emb: discord.Embed, summary: dict, minutes: float) -> None:
+    labels = {
+        "cpu_percent": "CPU",
+        "ram_percent": "RAM",
+        "disk_percent": "Disk",
+        "ws_latency": "Gateway latency",
+        "loop_lag": "Event loop lag"
+    }
+    lines = [f"**{label}:** {_format_window(name, summary.get(name))}" for name, label in labels.items()]
+    emb.add_field(
+        name=f"Last {minutes:g} min ({summary.get('samples', 0)} samples)",
+        value="\n".join(lines),
+        inline=False
+    )
+
+
 def _make_status_embed(status: dict) -> discord.Embed:
     title = f"System status · {status.get('state', 'UNKNOWN')}"
     state = status.get("state", "UNKNOWN")
@@ -199,6 +386,34 @@ def _make_status_embed(status: dict) -> discord.Embed:
     else:
         emb.add_field(name="Gateway latency", value="Unavailable", inline=True)
 
+    if status.get("loop_lag") is not None:
+        emb.add_field(name="Event loop lag", value=f"{status['loop_lag']*1000:.0f} ms", inline=True)
+
+    if status.get("latency"):
+        emb.add_field(
+            name="Latency p50 / p99",
+            value="\n".join(f"{name}: {p50*1000:.1f} / {p99*1000:.1f} ms" for name, (p50, p99) in status["latency"].items()),
+            inline=False
+        )
+    rates = status.get("message_rates")
+    if rates:
+        busiest = sorted(rates.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        emb.add_field(
+            name="Messages/s",
+            value="\n".join(f"{gid}: {rate:.2f}" for gid, rate in busiest) + f"\nTotal: {sum(rates.values()):.2f}",
+            inline=False
+        )
+
+    cache = status.get("filter_cache")
+    if cache:
+        lines = []
+        for kind, label in (("verdict", "Verdicts"), ("word", "Words")):
+            hits, misses = cache.get(f"{kind}_hits", 0), cache.get(f"{kind}_misses", 0)
+            if hits + misses:
+                lines.append(f"{label}: {hits / (hits + misses) * 100:.1f}% hit ({int(cache.get(f'{kind}_size', 0))} cached)")
+        if lines:
+            emb.add_field(name="Filter cache", value="\n".join(lines), inline=False)
+
     emb.add_field(name="OS", value=status.get("os", "Unknown"), inline=False)
     emb.add_field(name="Python", value=status.get("python_version", "Unknown"), inline=True)
     emb.add_field(name="Version", value=str(status.get("version", "unknown")), inline=True)
@@ -247,6 +462,8 @@ async def start_monitoring(bot: discord.Client, alert_channel_id: Optional[int]
     last_alert_time = None
 
     await bot.wait_until_ready()
+    sampler.start(bot, asyncio.get_running_loop())
+    profiler.start(asyncio.get_running_loop())
     chan = bot.get_channel(alert_channel_id) if alert_channel_id else None
 
     while not bot.is_closed():
@@ -326,13 +543,59 @@ async def _user_is_manager(bot: commands.Bot, member: discord.Member) -> bool:
 
 
 @watchdog_group.command(name="status", description="Show status of the bot")
-async def watchdog_status(interaction: discord.Interaction):
+@app_commands.describe(minutes="Also show min/avg/p95 over the last N minutes")
+async def watchdog_status(interaction: discord.Interaction, minutes: Optional[app_commands.Range[int, 1, 1440]] = None):
     await interaction.response.defer(thinking=True)
     status = await collect_status(interaction.client)
     emb = _make_status_embed(status)
+    if minutes:
+        _add_history_fields(emb, sampler.summary(minutes), minutes)
     await interaction.followup.send(embed=emb)
 
 
+def _make_lag_embed(top: int) -> discord.Embed:
+    sites = profiler.top(top)
+    color = discord.Color.green() if not sites else discord.Color.orange()
+    emb = discord.Embed(title="Event loop stalls", color=color, timestamp=datetime.now(timezone.utc))
+    emb.description = f"{profiler.stalls} stalls over {profiler.threshold*1000:.0f} ms since start"
+    if not sites:
+        emb.set_footer(text="Watchdog")
+        return emb
+
+    hist = " · ".join(f"{bucket_label(i)}: {n}" for i, n in enumerate(profiler.hist) if n)
+    emb.add_field(name="Histogram", value=hist or "empty", inline=False)
+    for site in sites:
+        emb.add_field(
+            name=site.name[:256],
+            value=f"{site.count}x, total {site.total:.2f}s, avg {site.total / site.count:.2f}s, worst {site.worst:.2f}s",
+            inline=False
+        )
+    worst = max(sites, key=lambda s: s.worst)
+    if worst.stack:
+        stack = "\n".join(worst.stack)
+        if len(stack) > 1000:
+            stack = "…" + stack[-1000:]
+        emb.add_field(name=f"Stack of worst stall ({worst.worst:.2f}s)", value=f"```{stack}```", inline=False)
+    emb.set_footer(text="Watchdog")
+    return emb
+
+
+@watchdog_group.command(name="lag", description="Show which code paths stalled the event loop")
+@app_commands.describe(top="How many call sites to list")
+async def watchdog_lag(interaction: discord.Interaction, top: Optional[app_commands.Range[int, 1, 15]] = 5):
+    if not isinstance(interaction.user, discord.Member):
+        await interaction.response.send_message("❌ This command must be used in a guild by a member.", ephemeral=True)
+        return
+
+    # stall stacks show file paths and internals, same gate as reboot
+    allowed = await _user_is_manager(interaction.client, interaction.user)
+    if not allowed:
+        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+
+    await interaction.response.send_message(embed=_make_lag_embed(top or 5), ephemeral=True)
+
+
 @watchdog_group.command(name="reboot", description="Reboots the bot. Useful to remotely restart bot in case of error state")
 async def watchdog_reboot(interaction: discord.Interaction):
     bot = interaction.client
@@ -368,5 +631,7 @@ class WatchdogCog(commands.Cog):
 
 
 async def setup(bot: commands.Bot):
+    sampler.start(bot, asyncio.get_running_loop())
+    profiler.start(asyncio.get_running_loop())
     await bot.add_cog(WatchdogCog(bot))
     bot.tree.add_command(watchdog_group)
\ No newline at end of file